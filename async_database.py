@@ -0,0 +1,98 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from config import get_config
+import database as db
+
+executor = None
+
+
+def init_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=get_config()['DB_POOL_SIZE'],
+            thread_name_prefix="mongo",
+        )
+    return executor
+
+
+def close_executor():
+    global executor
+    if executor is not None:
+        executor.shutdown(wait=True)
+        executor = None
+
+
+async def run(fn, *args, **kwargs):
+    # pymongo is blocking, so calls run on a dedicated pool sized to match the client's connection pool.
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+    return await loop.run_in_executor(init_executor(), call)
+
+
+async def listen_for_invalidations():
+    # Cross-worker cache invalidation: pick up entries other workers dropped.
+    poll_s = get_config()['CACHE_INVALIDATION_POLL_S']
+    state = await run(db.poll_invalidations)
+    while True:
+        await asyncio.sleep(poll_s)
+        try:
+            state = await run(db.poll_invalidations, state)
+        except Exception as e:
+            print(f"Error polling cache invalidations: {e}")
+
+
+def _wrap(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+    return wrapper
+
+
+get_user = _wrap(db.get_user)
+insert_new_user = _wrap(db.insert_new_user)
+get_user_by_uid = _wrap(db.get_user_by_uid)
+create_user_document = _wrap(db.create_user_document)
+get_token_version = _wrap(db.get_token_version)
+revoke_tokens = _wrap(db.revoke_tokens)
+get_page_data = _wrap(db.get_page_data)
+get_attendance = _wrap(db.get_attendance)
+get_timetable = _wrap(db.get_timetable)
+get_courses = _wrap(db.get_courses)
+update_attendance = _wrap(db.update_attendance)
+update_timetable = _wrap(db.update_timetable)
+update_courses = _wrap(db.update_courses)
+save_session = _wrap(db.save_session)
+load_session = _wrap(db.load_session)
+load_session_record = _wrap(db.load_session_record)
+get_refresh_states = _wrap(db.get_refresh_states)
+get_refresh_state = _wrap(db.get_refresh_state)
+block_refresh = _wrap(db.block_refresh)
+acquire_lease = _wrap(db.acquire_lease)
+renew_lease = _wrap(db.renew_lease)
+release_lease = _wrap(db.release_lease)
+get_lease = _wrap(db.get_lease)
+get_lease_holders = _wrap(db.get_lease_holders)
+touch_session = _wrap(db.touch_session)
+get_last_updated = _wrap(db.get_last_updated)
+update_last_updated = _wrap(db.update_last_updated)
+update_profile = _wrap(db.update_profile)
+update_marks = _wrap(db.update_marks)
+update_datesheet = _wrap(db.update_datesheet)
+update_result = _wrap(db.update_result)
+update_leaves = _wrap(db.update_leaves)
+update_fees = _wrap(db.update_fees)
+get_marks = _wrap(db.get_marks)
+get_result = _wrap(db.get_result)
+get_profile = _wrap(db.get_profile)
+get_leaves = _wrap(db.get_leaves)
+get_fees = _wrap(db.get_fees)
+get_datesheet = _wrap(db.get_datesheet)
+get_version = _wrap(db.get_version)
+recompute_attendance = _wrap(db.recompute_attendance)
+get_attendance_goal = _wrap(db.get_attendance_goal)
+set_goal_value = _wrap(db.set_goal_value)
+update_session_first = _wrap(db.update_session_first)
+get_session_first = _wrap(db.get_session_first)
@@ -0,0 +1,67 @@
+import numpy as np
+
+STATUSES = np.array(["safe", "warning", "critical"])
+UNLIMITED = -1
+
+
+def project(attended, total, goal):
+    # Closed form of the old step-one-class-at-a-time loops, vectorised so a single call covers
+    # one user's subjects or every subject of every user. goal may be a scalar or one per row.
+    attended = np.asarray(attended, dtype=np.int64)
+    total = np.asarray(total, dtype=np.int64)
+    goal = np.broadcast_to(np.asarray(goal, dtype=np.int64), total.shape)
+    delivered = total > 0
+    percentage = np.where(delivered, np.round(attended / np.where(delivered, total, 1) * 100, 2), 0.0)
+
+    # surplus / goal is how far attended/(total + x) can fall before dropping under the goal;
+    # -surplus / (100 - goal), rounded up, is how many present days lift it back over.
+    surplus = 100 * attended - goal * total
+    can_miss = np.where(goal > 0, surplus // np.maximum(goal, 1), UNLIMITED)
+    need = np.where(goal < 100, -(surplus // np.maximum(100 - goal, 1)), UNLIMITED)
+
+    # Status still compares the rounded percentage, as shown on the dashboard.
+    status = np.where(~delivered | (percentage < goal), 2, np.where(percentage > goal, 0, 1))
+    return {
+        "percentage": percentage,
+        "status": STATUSES[status],
+        "can_miss": can_miss,
+        "need": need,
+        "delivered": delivered,
+    }
+
+
+def _plural(n):
+    return f"{n} more class{'es' if n != 1 else ''}"
+
+
+def message(status, delivered, can_miss, need):
+    if not delivered:
+        return "❌ No classes delivered yet"
+    if status == "safe":
+        if can_miss == UNLIMITED:
+            return "✅ You can miss any number of classes"
+        return f"✅ You can miss {_plural(can_miss)}"
+    if status == "warning":
+        return "⚠️ You're exactly at the limit!"
+    if need == UNLIMITED:
+        return "❌ The goal can no longer be reached"
+    return f"❌ You have to attend {_plural(need)}"
+
+
+def reproject(subjects, goal):
+    # Rebuilds the derived fields from the stored attended/total counts.
+    if not subjects:
+        return []
+    result = project([s['attended'] for s in subjects], [s['total'] for s in subjects], goal)
+    projected = []
+    for i, subject in enumerate(subjects):
+        status = str(result["status"][i])
+        can_miss, need = int(result["can_miss"][i]), int(result["need"][i])
+        projected.append({
+            **subject,
+            "missed": subject['total'] - subject['attended'],
+            "percentage": float(result["percentage"][i]),
+            "can_miss_message": message(status, bool(result["delivered"][i]), can_miss, need),
+            "status": status,
+        })
+    return projected
@@ -0,0 +1,50 @@
+import argparse
+import time
+import numpy as np
+import captcha_solver
+from config import get_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accuracy and latency of the offline captcha solver.")
+    parser.add_argument('--corpus', default=get_config()['CAPTCHA_CORPUS_DIR'])
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--min-confidence', type=float, default=get_config()['CAPTCHA_MIN_CONFIDENCE'])
+    args = parser.parse_args()
+
+    samples = captcha_solver.load_corpus(args.corpus)
+    if len(samples) < args.folds:
+        print(f"Need at least {args.folds} labelled samples in {args.corpus}, found {len(samples)}")
+        return
+
+    # k-fold: every sample is scored by templates built without it.
+    correct, chars, chars_correct, confident, confident_correct = 0, 0, 0, 0, 0
+    latencies = []
+    for fold in range(args.folds):
+        train = [s for i, s in enumerate(samples) if i % args.folds != fold]
+        test = [s for i, s in enumerate(samples) if i % args.folds == fold]
+        templates = captcha_solver.build_templates(train)
+        for label, image_bytes in test:
+            started = time.perf_counter()
+            text, confidence = captcha_solver.classify(image_bytes, templates)
+            latencies.append((time.perf_counter() - started) * 1000)
+            correct += text == label
+            chars += len(label)
+            chars_correct += sum(a == b for a, b in zip(text, label))
+            if confidence >= args.min_confidence:
+                confident += 1
+                confident_correct += text == label
+
+    total = len(samples)
+    latencies = np.array(latencies)
+    print(f"samples:             {total}")
+    print(f"text accuracy:       {correct / total:.1%}")
+    print(f"char accuracy:       {chars_correct / chars:.1%}")
+    print(f"confident (>= {args.min_confidence}): {confident / total:.1%} of samples, "
+          f"{(confident_correct / confident if confident else 0):.1%} correct")
+    print(f"latency ms:          p50 {np.percentile(latencies, 50):.2f}  "
+          f"p95 {np.percentile(latencies, 95):.2f}  max {latencies.max():.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from config import get_config
+import psutil
+
+pool = None
+
+
+class PooledBrowser:
+    def __init__(self, browser, root_pids):
+        self.browser = browser
+        self.root_pids = root_pids
+        self.active = 0
+        self.served = 0
+        self.retiring = False
+
+    def memory_mb(self):
+        total = 0
+        for pid in self.root_pids:
+            try:
+                root = psutil.Process(pid)
+                for proc in [root] + root.children(recursive=True):
+                    total += proc.memory_info().rss
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return total / (1024 * 1024)
+
+
+class BrowserPool:
+    def __init__(self, size=2, max_contexts_per_browser=50, max_contexts=8, max_memory_mb=800):
+        self.size = size
+        self.max_contexts_per_browser = max_contexts_per_browser
+        self.max_memory_mb = max_memory_mb
+        self.playwright = None
+        self.browsers = []
+        self.slots = asyncio.Semaphore(max_contexts)
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+        self.recycled = 0
+
+    async def start(self):
+        async with self.lock:
+            if self.playwright is None:
+                self.playwright = await async_playwright().start()
+
+    async def stop(self):
+        async with self.lock:
+            for pooled in self.browsers:
+                await self._close(pooled)
+            self.browsers = []
+            if self.playwright is not None:
+                await self.playwright.stop()
+                self.playwright = None
+
+    async def _launch(self):
+        # Diff the process tree around the launch so memory can be attributed per browser.
+        before = _descendant_pids()
+        browser = await self.playwright.chromium.launch(headless=True)
+        spawned = {proc.pid: proc for proc in _descendants() if proc.pid not in before}
+        roots = set()
+        for pid, proc in spawned.items():
+            try:
+                if proc.ppid() not in spawned:
+                    roots.add(pid)
+            except psutil.NoSuchProcess:
+                continue
+        pooled = PooledBrowser(browser, roots)
+        self.browsers.append(pooled)
+        return pooled
+
+    async def _close(self, pooled):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            print(f"Error closing pooled browser: {e}")
+
+    async def _checkout(self):
+        await self.start()
+        async with self.lock:
+            for pooled in list(self.browsers):
+                if not pooled.browser.is_connected() and pooled.active == 0:
+                    self.browsers.remove(pooled)
+                    self.recycled += 1
+            live = [b for b in self.browsers if not b.retiring and b.browser.is_connected()]
+            if len(live) < self.size:
+                pooled = await self._launch()
+            else:
+                pooled = min(live, key=lambda b: b.active)
+            pooled.active += 1
+            pooled.served += 1
+            return pooled
+
+    async def _checkin(self, pooled):
+        async with self.lock:
+            pooled.active -= 1
+            if not pooled.retiring and (
+                pooled.served >= self.max_contexts_per_browser
+                or not pooled.browser.is_connected()
+                or (self.max_memory_mb and pooled.memory_mb() > self.max_memory_mb)
+            ):
+                pooled.retiring = True
+            if pooled.retiring and pooled.active == 0:
+                self.browsers.remove(pooled)
+                self.recycled += 1
+                await self._close(pooled)
+
+    @asynccontextmanager
+    async def context(self, **kwargs):
+        self.waiters += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiters -= 1
+        try:
+            pooled = await self._checkout()
+            try:
+                context = await pooled.browser.new_context(**kwargs)
+                try:
+                    yield context
+                finally:
+                    await context.close()
+            finally:
+                await self._checkin(pooled)
+        finally:
+            self.slots.release()
+
+    def stats(self):
+        return {
+            "browsers": len(self.browsers),
+            "contexts": sum(b.active for b in self.browsers),
+            "waiters": self.waiters,
+            "recycled": self.recycled,
+            "memory_mb": round(sum(b.memory_mb() for b in self.browsers), 1),
+        }
+
+
+def _descendants():
+    return psutil.Process(os.getpid()).children(recursive=True)
+
+
+def _descendant_pids():
+    return {proc.pid for proc in _descendants()}
+
+
+def init_pool():
+    global pool
+    if pool is None:
+        config = get_config()
+        pool = BrowserPool(
+            size=config['BROWSER_POOL_SIZE'],
+            max_contexts_per_browser=config['BROWSER_MAX_CONTEXTS_PER_BROWSER'],
+            max_contexts=config['BROWSER_MAX_CONTEXTS'],
+            max_memory_mb=config['BROWSER_MAX_MEMORY_MB'],
+        )
+    return pool
+
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.stop()
+        pool = None
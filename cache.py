@@ -0,0 +1,100 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+import bson
+
+MISSING = object()
+
+
+def estimate_size(value):
+    try:
+        return len(bson.encode({'v': value}))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+class TTLCache:
+    def __init__(self, max_entries=5000, max_bytes=64 * 1024 * 1024, ttl_s=600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.entries = OrderedDict()
+        # Every invalidate advances the generation and records it for the key, so a load that raced a
+        # write can tell its value is stale. Only the newest max_entries keys are remembered; a load
+        # older than the last one forgotten is dropped rather than trusted.
+        self.generation_counter = 0
+        self.invalidated_at = OrderedDict()
+        self.forgotten_before = 0
+        self.bytes = 0
+        # Reads and writes come from the Mongo executor threads as well as the event loop.
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires_at, size, value = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def generation(self, key):
+        with self.lock:
+            return self.generation_counter
+
+    def set(self, key, value, generation=None):
+        # Pass the generation read before loading; the value is dropped if the key was invalidated since.
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if generation is not None and (
+                generation < self.forgotten_before or self.invalidated_at.get(key, 0) > generation
+            ):
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl_s, size, value)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        with self.lock:
+            self.generation_counter += 1
+            self.invalidated_at[key] = self.generation_counter
+            self.invalidated_at.move_to_end(key)
+            while len(self.invalidated_at) > self.max_entries:
+                _, generation = self.invalidated_at.popitem(last=False)
+                self.forgotten_before = generation
+            if key in self.entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def _remove(self, key):
+        _, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,286 @@
+import asyncio
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageFilter
+from config import get_config
+
+GLYPH_SIZE = 16
+MIN_GLYPH_WIDTH = 2
+MIN_GLYPH_PIXELS = 6
+HEIGHT_PENALTY = 0.25
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+solver = None
+
+# Per worker process: glyphs segmented once per corpus file, and the templates assembled from them.
+# A new sample costs one segmentation, not a rebuild of the whole corpus.
+_samples = {}
+_templates = None
+_templates_key = None
+
+
+def binarize(image_bytes):
+    img = Image.open(BytesIO(image_bytes)).convert('L').filter(ImageFilter.MedianFilter(3))
+    pixels = np.asarray(img, dtype=np.uint8)
+    # Otsu: pick the threshold that maximises between-class variance.
+    hist = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(hist)
+    mean = np.cumsum(hist * np.arange(256))
+    total_weight, total_mean = weight[-1], mean[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (total_mean * weight - mean * total_weight) ** 2 / (weight * (total_weight - weight))
+    threshold = int(np.nanargmax(between))
+    ink = pixels <= threshold
+    # Text is the minority class; flip if the background came out as ink.
+    if ink.mean() > 0.5:
+        ink = ~ink
+    return ink
+
+
+def segment(ink):
+    columns = ink.sum(axis=0)
+    runs, start = [], None
+    for x, count in enumerate(columns):
+        if count and start is None:
+            start = x
+        elif not count and start is not None:
+            runs.append((start, x))
+            start = None
+    if start is not None:
+        runs.append((start, len(columns)))
+    runs = [(a, b) for a, b in runs if b - a >= MIN_GLYPH_WIDTH and ink[:, a:b].sum() >= MIN_GLYPH_PIXELS]
+    if not runs:
+        return []
+    # Specks left over from background noise carry far less ink than any real character.
+    mass = [ink[:, a:b].sum() for a, b in runs]
+    runs = [run for run, m in zip(runs, mass) if m >= 0.25 * np.median(mass)]
+
+    # Touching characters show up as one wide run; split at the thinnest column near the middle.
+    median = float(np.median([b - a for a, b in runs]))
+    split = []
+    for a, b in runs:
+        pieces = max(1, int(round((b - a) / median))) if median else 1
+        if pieces == 1:
+            split.append((a, b))
+            continue
+        edges = [a]
+        for i in range(1, pieces):
+            guess = a + (b - a) * i // pieces
+            lo, hi = max(edges[-1] + 1, guess - 2), min(b - 1, guess + 3)
+            edges.append(lo + int(np.argmin(columns[lo:hi])) if hi > lo else guess)
+        edges.append(b)
+        split.extend(zip(edges, edges[1:]))
+
+    crops = []
+    for a, b in split:
+        rows = np.flatnonzero(ink[:, a:b].any(axis=1))
+        if len(rows):
+            crops.append(ink[rows[0]:rows[-1] + 1, a:b])
+    if not crops:
+        return []
+    # Tight crops lose size, so keep each glyph's height relative to its neighbours (x vs X).
+    height = float(np.median([crop.shape[0] for crop in crops]))
+    return [(normalize(crop), crop.shape[0] / height) for crop in crops]
+
+
+def normalize(crop):
+    # Centre on a square canvas so the resize keeps the glyph's aspect ratio (l vs L).
+    side = max(crop.shape)
+    canvas = np.zeros((side, side), dtype=np.uint8)
+    top, left = (side - crop.shape[0]) // 2, (side - crop.shape[1]) // 2
+    canvas[top:top + crop.shape[0], left:left + crop.shape[1]] = crop * 255
+    img = Image.fromarray(canvas).resize((GLYPH_SIZE, GLYPH_SIZE), Image.BILINEAR)
+    vector = np.asarray(img, dtype=np.float32).ravel()
+    vector -= vector.mean()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def corpus_files(corpus_dir):
+    # Samples are stored as <label>_<id>.png; the label is the text the site accepted.
+    if not corpus_dir or not os.path.isdir(corpus_dir):
+        return []
+    return [
+        name for name in os.listdir(corpus_dir)
+        if name.endswith('.png') and name.partition('_')[0] and name.partition('_')[2]
+    ]
+
+
+def load_corpus(corpus_dir):
+    samples = []
+    for name in sorted(corpus_files(corpus_dir)):
+        with open(os.path.join(corpus_dir, name), 'rb') as f:
+            samples.append((name.partition('_')[0], f.read()))
+    return samples
+
+
+def sample_glyphs(label, image_bytes):
+    glyphs = segment(binarize(image_bytes))
+    # Only trust samples where segmentation lines up with the label.
+    return glyphs if len(glyphs) == len(label) else []
+
+
+def assemble(samples):
+    # samples: (label, glyphs) pairs, with glyphs empty for samples that failed to segment.
+    vectors, heights, labels, lengths = [], [], [], []
+    for label, glyphs in samples:
+        lengths.append(len(label))
+        vectors.extend(vector for vector, _ in glyphs)
+        heights.extend(height for _, height in glyphs)
+        labels.extend(label[:len(glyphs)])
+    if not vectors:
+        return None
+    # Captchas come in a fixed length, so a guess of any other length is a segmentation miss.
+    length = int(np.bincount(lengths).argmax())
+    return np.vstack(vectors), np.array(heights), np.array(labels), length
+
+
+def build_templates(samples):
+    return assemble([(label, sample_glyphs(label, image_bytes)) for label, image_bytes in samples])
+
+
+def classify(image_bytes, templates):
+    if templates is None:
+        return "", 0.0
+    matrix, heights, labels, length = templates
+    glyphs = segment(binarize(image_bytes))
+    if not glyphs:
+        return "", 0.0
+    vectors = np.vstack([vector for vector, _ in glyphs])
+    glyph_heights = np.array([height for _, height in glyphs])
+    scores = vectors @ matrix.T - HEIGHT_PENALTY * np.abs(glyph_heights[:, None] - heights[None, :])
+    best = scores.argmax(axis=1)
+    text = "".join(labels[best])
+    # The weakest character bounds how far the whole guess can be trusted.
+    confidence = float(np.clip(scores[np.arange(len(best)), best], 0.0, 1.0).min())
+    if len(glyphs) != length:
+        confidence = 0.0
+    return text, round(confidence, 3)
+
+
+def _corpus_key(corpus_dir):
+    try:
+        stat = os.stat(corpus_dir)
+    except OSError:
+        return None
+    return (corpus_dir, stat.st_mtime_ns)
+
+
+def _sync(corpus_dir):
+    # Picks up files added or rotated out since the last sync; unchanged samples are reused as is.
+    names = set(corpus_files(corpus_dir))
+    for name in set(_samples) - names:
+        del _samples[name]
+    for name in names - set(_samples):
+        try:
+            with open(os.path.join(corpus_dir, name), 'rb') as f:
+                image_bytes = f.read()
+        except OSError:
+            continue
+        label = name.partition('_')[0]
+        _samples[name] = (label, sample_glyphs(label, image_bytes))
+    return assemble(_samples.values())
+
+
+def warm(corpus_dir):
+    solve(None, corpus_dir)
+
+
+def solve(image_bytes, corpus_dir):
+    global _templates, _templates_key
+    key = _corpus_key(corpus_dir)
+    if key != _templates_key:
+        if key is None or (_templates_key and _templates_key[0] != corpus_dir):
+            _samples.clear()
+        _templates = _sync(corpus_dir)
+        _templates_key = key
+    if image_bytes is None:
+        return "", 0.0
+    return classify(image_bytes, _templates)
+
+
+class CaptchaSolver:
+    def __init__(self, corpus_dir, workers=1, min_confidence=0.8, mode='auto', max_samples=2000):
+        self.corpus_dir = corpus_dir
+        self.max_samples = max_samples
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # Segment the existing corpus in the background rather than on the first login.
+        for _ in range(workers):
+            self.executor.submit(warm, corpus_dir)
+        self.solved = 0
+        self.confident = 0
+        self.recorded = 0
+        self.rotated = 0
+        self.solve_ms = 0.0
+
+    async def solve(self, image_bytes):
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        text, confidence = await loop.run_in_executor(self.executor, solve, image_bytes, self.corpus_dir)
+        self.solved += 1
+        self.solve_ms += (time.perf_counter() - started) * 1000
+        if confidence >= self.min_confidence:
+            self.confident += 1
+        return text, confidence
+
+    def record(self, image_bytes, text):
+        # Called after the site accepted the captcha, so the label is confirmed.
+        if not self.corpus_dir or not text or any(c not in ALPHABET for c in text):
+            return
+        try:
+            os.makedirs(self.corpus_dir, exist_ok=True)
+            with open(os.path.join(self.corpus_dir, f"{text}_{uuid.uuid4().hex[:8]}.png"), 'wb') as f:
+                f.write(image_bytes)
+            self.recorded += 1
+            self._rotate()
+        except OSError as e:
+            print(f"Could not record captcha sample: {e}")
+
+    def _rotate(self):
+        # Keeps the newest max_samples files, so disk use and template size stay bounded.
+        paths = [os.path.join(self.corpus_dir, name) for name in corpus_files(self.corpus_dir)]
+        if len(paths) <= self.max_samples:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_samples]:
+            os.remove(path)
+            self.rotated += 1
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        return {
+            "solved": self.solved,
+            "confident": self.confident,
+            "recorded": self.recorded,
+            "rotated": self.rotated,
+            "avg_solve_ms": round(self.solve_ms / self.solved, 1) if self.solved else 0.0,
+        }
+
+
+def init_solver():
+    global solver
+    if solver is None:
+        config = get_config()
+        solver = CaptchaSolver(
+            config['CAPTCHA_CORPUS_DIR'],
+            workers=config['CAPTCHA_WORKERS'],
+            min_confidence=config['CAPTCHA_MIN_CONFIDENCE'],
+            mode=config['CAPTCHA_SOLVER'],
+            max_samples=config['CAPTCHA_CORPUS_MAX'],
+        )
+    return solver
+
+
+def close_solver():
+    global solver
+    if solver is not None:
+        solver.close()
+        solver = None
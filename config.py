@@ -6,5 +6,68 @@ def get_config():
         'MONGO_URI': os.environ.get('MONGO_URI'),
         'FERNET_KEY': os.environ.get('FERNET_KEY'),
         'OCR_KEY': os.environ.get('OCR_KEY'),
-        'SESSION_TYPE': 'filesystem'
+        'CAPTCHA_SOLVER': os.environ.get('CAPTCHA_SOLVER', 'auto'),
+        'CAPTCHA_CORPUS_DIR': os.environ.get('CAPTCHA_CORPUS_DIR', os.path.expanduser('~/.cache/cuims/captcha_corpus')),
+        'CAPTCHA_CORPUS_MAX': int(os.environ.get('CAPTCHA_CORPUS_MAX', 2000)),
+        'CAPTCHA_WORKERS': int(os.environ.get('CAPTCHA_WORKERS', 1)),
+        'CAPTCHA_MIN_CONFIDENCE': float(os.environ.get('CAPTCHA_MIN_CONFIDENCE', 0.8)),
+        'OCR_TIMEOUT': float(os.environ.get('OCR_TIMEOUT', 5)),
+        'OCR_RETRIES': int(os.environ.get('OCR_RETRIES', 2)),
+        'OCR_BREAKER_FAILURES': int(os.environ.get('OCR_BREAKER_FAILURES', 5)),
+        'OCR_BREAKER_RESET_S': float(os.environ.get('OCR_BREAKER_RESET_S', 30)),
+        'OCR_RATE_PER_S': float(os.environ.get('OCR_RATE_PER_S', 2)),
+        'OCR_MAX_CONCURRENCY': int(os.environ.get('OCR_MAX_CONCURRENCY', 4)),
+        'CUIMS_RATE_PER_S': float(os.environ.get('CUIMS_RATE_PER_S', 10)),
+        'CUIMS_BURST': int(os.environ.get('CUIMS_BURST', 20)),
+        'CUIMS_MAX_CONCURRENCY': int(os.environ.get('CUIMS_MAX_CONCURRENCY', 12)),
+        'CUIMS_TARGET_LATENCY_MS': int(os.environ.get('CUIMS_TARGET_LATENCY_MS', 8000)),
+        'LOGIN_MAX_ATTEMPTS': int(os.environ.get('LOGIN_MAX_ATTEMPTS', 5)),
+        'LOGIN_BACKOFF_S': float(os.environ.get('LOGIN_BACKOFF_S', 1)),
+        'LOGIN_BACKOFF_MAX_S': float(os.environ.get('LOGIN_BACKOFF_MAX_S', 15)),
+        'LOGIN_NAV_TIMEOUT_MS': int(os.environ.get('LOGIN_NAV_TIMEOUT_MS', 15000)),
+        'SESSION_KEEPALIVE_INTERVAL_S': int(os.environ.get('SESSION_KEEPALIVE_INTERVAL_S', 300)),
+        'SESSION_KEEPALIVE_AFTER_S': int(os.environ.get('SESSION_KEEPALIVE_AFTER_S', 900)),
+        'SESSION_ACTIVE_WINDOW_S': int(os.environ.get('SESSION_ACTIVE_WINDOW_S', 86400)),
+        'SESSION_TYPE': 'filesystem',
+        'BROWSER_POOL_SIZE': int(os.environ.get('BROWSER_POOL_SIZE', 2)),
+        'BROWSER_MAX_CONTEXTS': int(os.environ.get('BROWSER_MAX_CONTEXTS', 8)),
+        'BROWSER_MAX_CONTEXTS_PER_BROWSER': int(os.environ.get('BROWSER_MAX_CONTEXTS_PER_BROWSER', 50)),
+        'BROWSER_MAX_MEMORY_MB': int(os.environ.get('BROWSER_MAX_MEMORY_MB', 800)),
+        'ONBOARDING_MAX_SESSIONS': int(os.environ.get('ONBOARDING_MAX_SESSIONS', 4)),
+        'ONBOARDING_IDLE_TTL_S': int(os.environ.get('ONBOARDING_IDLE_TTL_S', 180)),
+        'ONBOARDING_OPEN_TIMEOUT_S': float(os.environ.get('ONBOARDING_OPEN_TIMEOUT_S', 15)),
+        'ONBOARDING_FORWARD_TIMEOUT_S': float(os.environ.get('ONBOARDING_FORWARD_TIMEOUT_S', 120)),
+        'LEASE_TTL_S': int(os.environ.get('LEASE_TTL_S', 60)),
+        'LEASE_WAIT_S': int(os.environ.get('LEASE_WAIT_S', 300)),
+        'WORKER_URL': os.environ.get('WORKER_URL', ''),
+        'SCRAPE_CONCURRENCY': int(os.environ.get('SCRAPE_CONCURRENCY', 4)),
+        'SCRAPE_ENGINES': os.environ.get('SCRAPE_ENGINES', ''),
+        'HTTP_TIMEOUT': float(os.environ.get('HTTP_TIMEOUT', 15)),
+        'HTTP_MAX_CONNECTIONS': int(os.environ.get('HTTP_MAX_CONNECTIONS', 20)),
+        'REFRESH_WORKERS': int(os.environ.get('REFRESH_WORKERS', 2)),
+        'REFRESH_MAX_QUEUED': int(os.environ.get('REFRESH_MAX_QUEUED', 100)),
+        'SCHEDULER_WORKERS': int(os.environ.get('SCHEDULER_WORKERS', 1)),
+        'SCHEDULER_MODE': os.environ.get('SCHEDULER_MODE', 'initial'),
+        'SCHEDULER_SCAN_S': int(os.environ.get('SCHEDULER_SCAN_S', 300)),
+        'SCHEDULER_STALE_AFTER_S': int(os.environ.get('SCHEDULER_STALE_AFTER_S', 6 * 3600)),
+        'SCHEDULER_MAX_STALE_S': int(os.environ.get('SCHEDULER_MAX_STALE_S', 24 * 3600)),
+        'SCHEDULER_PEAK_HOURS': os.environ.get('SCHEDULER_PEAK_HOURS', '7-10,17-19'),
+        'SCHEDULER_RETRY_AFTER_S': int(os.environ.get('SCHEDULER_RETRY_AFTER_S', 6 * 3600)),
+        'DB_POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'DB_MIN_POOL_SIZE': int(os.environ.get('DB_MIN_POOL_SIZE', 1)),
+        'DB_MAX_IDLE_TIME_MS': int(os.environ.get('DB_MAX_IDLE_TIME_MS', 300000)),
+        'DB_CONNECT_TIMEOUT_MS': int(os.environ.get('DB_CONNECT_TIMEOUT_MS', 10000)),
+        'DB_SERVER_SELECTION_TIMEOUT_MS': int(os.environ.get('DB_SERVER_SELECTION_TIMEOUT_MS', 10000)),
+        'NEW_USER_TTL_S': int(os.environ.get('NEW_USER_TTL_S', 7 * 24 * 3600)),
+        'SESSION_FIRST_TTL_S': int(os.environ.get('SESSION_FIRST_TTL_S', 3600)),
+        'CACHE_MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 5000)),
+        'CACHE_MAX_MB': int(os.environ.get('CACHE_MAX_MB', 64)),
+        'CACHE_TTL_S': int(os.environ.get('CACHE_TTL_S', 600)),
+        'CACHE_INVALIDATION_CHANNEL': os.environ.get('CACHE_INVALIDATION_CHANNEL', ''),
+        'CACHE_INVALIDATION_POLL_S': float(os.environ.get('CACHE_INVALIDATION_POLL_S', 2)),
+        'RENDER_CACHE_MAX_ENTRIES': int(os.environ.get('RENDER_CACHE_MAX_ENTRIES', 2000)),
+        'RENDER_CACHE_MAX_MB': int(os.environ.get('RENDER_CACHE_MAX_MB', 32)),
+        'RENDER_CACHE_TTL_S': int(os.environ.get('RENDER_CACHE_TTL_S', 86400)),
+        'AUTH_CACHE_TTL_S': int(os.environ.get('AUTH_CACHE_TTL_S', 300)),
+        'AUTH_CACHE_MAX_ENTRIES': int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', 10000))
     }
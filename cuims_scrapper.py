@@ -1,190 +1,140 @@
-from playwright.async_api import async_playwright
-import json
+import asyncio
 from typing import Dict
-import database as db
+import async_database as adb
 from datetime import datetime
-from PIL import Image
-from io import BytesIO
 import time
+import random
 import utils as utils
+import browser_pool
+import captcha_solver
+import events
+import governor
+import http_engine
+import dom_extract as dom
+import sections
+import timings
+import readiness
+import session_manager
+from request_filter import RequestFilter
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+from config import get_config
+
+
+REFRESH_MODES = {
+    'initial': ['courses', 'timetable', 'attendance'],
+    'all': ['attendance', 'courses', 'timetable', 'marks', 'profile', 'result', 'leaves', 'datesheet', 'fees'],
+    'marks': ['marks'],
+    'result': ['result'],
+    'leaves': ['leaves'],
+    'profile': ['profile'],
+    'datesheet': ['datesheet'],
+    'fees': ['fees'],
+}
+
+# Sections in the same group share one page and run in order,
+# e.g. _scrape_timetable reads the page _scrape_courses navigated to.
+PAGE_GROUPS = [
+    ['courses', 'timetable'],
+    ['attendance'],
+    ['marks'],
+    ['profile'],
+    ['result'],
+    ['leaves'],
+    ['datesheet'],
+    ['fees'],
+]
+
+
+HOME_URL = f"{sections.BASE_URL}/StudentHome.aspx"
+LOGIN_ERROR_SELECTOR = "[id*='lblError' i], [id*='lblMsg' i], [id*='lblMessage' i], .alert-danger, .error"
+
+
+class LoginFailed(Exception):
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+def classify_login_error(message):
+    text = (message or "").lower()
+    if "captcha" in text:
+        return "bad_captcha"
+    if any(word in text for word in ("password", "invalid user", "user id", "locked", "not valid")):
+        return "bad_password"
+    return "unknown"
 
 
 class CUIMSScraper:
     def __init__(self):
         self.login_url = f"https://students.cuchd.in/Login.aspx"
-        db.init_db()
+        self.timings = {}
+        self.failed = {}
+        self.http = None
+        self.request_filter = RequestFilter()
+        self.progress = None
+        self.uid = None
+        self.login_attempts = []
+        self.session_reused = False
+        config = get_config()
+        self.login_max_attempts = config['LOGIN_MAX_ATTEMPTS']
+        self.login_backoff_s = config['LOGIN_BACKOFF_S']
+        self.login_backoff_max_s = config['LOGIN_BACKOFF_MAX_S']
+        self.login_nav_timeout_ms = config['LOGIN_NAV_TIMEOUT_MS']
         
-    async def scrape_user_data(self, uid,password, data_to_be_fetched) -> Dict:
-        db.update_last_updated(uid, "Refreshing Data")
+    async def scrape_user_data(self, uid,password, data_to_be_fetched, progress=None) -> Dict:
+        # Checked before anything else so a bad mode never costs a captcha login.
+        requested = REFRESH_MODES.get(data_to_be_fetched)
+        if requested is None:
+            return {
+                "status": "error",
+                "message": f"Unknown data_to_be_fetched: {data_to_be_fetched}",
+                "scraped_at": datetime.now().isoformat()
+            }
+
+        await adb.update_last_updated(uid, "Refreshing Data")
+        self.uid = uid
+        self.progress = progress
+        self._report("logging_in")
         
-        async with async_playwright() as p:
-            logged_in = False
-            browser = await p.chromium.launch(headless=True)
-            context = None
-            page = None
-
-            saved_state = db.load_session(uid)
-            if saved_state:
-                context = await browser.new_context(storage_state=saved_state)
-                page = await context.new_page()
-                await page.goto("https://students.cuchd.in/StudentHome.aspx")
-                await page.wait_for_load_state("load")
-                if page.url == "https://students.cuchd.in/StudentHome.aspx":
-                    logged_in = True
-            
-            if not logged_in:
-                context = await browser.new_context()
-                page = await context.new_page()
+        sessions = session_manager.init_manager()
+        saved_state = await sessions.validate(uid, await adb.load_session_record(uid))
+        self.session_reused = saved_state is not None
+        pool = browser_pool.init_pool()
 
+        async with pool.context(storage_state=saved_state) as context:
             try:
-                while not logged_in:
-                    await page.goto("https://students.cuchd.in/StudentHome.aspx")
-                    captcha_img = await self._login_first(page, uid, password)
-                    if captcha_img:
-                        captcha_txt = await utils.extract_captcha_from_img(captcha_img)
-                        success = await self._login_second(page, uid, password, captcha_txt)
-                        if success:
-                            storage_state = await context.storage_state()
-                            db.save_session(uid, storage_state)
-                            logged_in = True
-                        else:
-                            print("Login failed. Retrying...")
-                            continue
-                    else:
-                        print("Captcha image not found. Retrying...")
-                        continue
-
-                if data_to_be_fetched == "initial":
-                
-                    courses_data = await self._scrape_courses(page)
-                    print("Courses data scraped successfully.")
-                        
-                    timetable_data =await self._scrape_timetable(page)
-                    print("Timetable data scraped successfully.")
-                        
-                    attendance_data = await self._scrape_attendance(page)
-                    print("Attendance data scraped successfully.")
-                    
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "attendance": attendance_data,
-                            "timetable": timetable_data,
-                            "courses": courses_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                    
-                elif data_to_be_fetched == 'marks':
-                    marks_data = await self._scrape_marks(page)
-                    print("Marks data scraped successfully.")
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "marks": marks_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                    
-                    
-                elif data_to_be_fetched == 'result':
-                    result_data = await self._scrape_result(page)
-                    print("Result data scraped successfully.")
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "result": result_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                    
-                elif data_to_be_fetched == 'leaves':
-                    leaves_data = await self._scrape_leaves(page)
-                    print("Leaves data scraped successfully.")
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "leaves": leaves_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                    
-                elif data_to_be_fetched == 'profile':                
-                    profile_data = await self._scrape_profile(page)
-                    print("Profile data scraped successfully.")
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "profile": profile_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                    
-                elif data_to_be_fetched == 'datesheet':
-                    datesheet_data = await self._scrape_datesheet(page)
-                    print("Datesheet data scraped successfully.")
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "datesheet": datesheet_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                    
-                elif data_to_be_fetched == 'fees':
-                    fees_data = await self._scrape_fees(page)
-                    print("Fees data scraped successfully.")
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "fees": fees_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                elif data_to_be_fetched == 'all':
-                    attendance_data = await self._scrape_attendance(page)
-                    print("Attendance data scraped successfully.")
-                    courses_data = await self._scrape_courses(page)
-                    print("Courses data scraped successfully.")
-                    timetable_data = await self._scrape_timetable(page)
-                    print("Timetable data scraped successfully.")
-                    marks_data = await self._scrape_marks(page)
-                    print("Marks data scraped successfully.")
-                    profile_data = await self._scrape_profile(page)
-                    print("Profile data scraped successfully.")
-                    result_data = await self._scrape_result(page)
-                    print("Result data scraped successfully.")
-                    leaves_data = await self._scrape_leaves(page)
-                    print("Leaves data scraped successfully.")
-                    datesheet_data = await self._scrape_datesheet(page)
-                    print("Datesheet data scraped successfully.")
-                    fees_data = await self._scrape_fees(page)
-                    print("Fees data scraped successfully.")
-                    return {
-                        "status": "success",
-                        "data": {
-                            "uid": uid,
-                            "attendance": attendance_data,
-                            "courses": courses_data,
-                            "timetable": timetable_data,
-                            "marks": marks_data,
-                            "profile": profile_data,
-                            "result": result_data,
-                            "leaves": leaves_data,
-                            "datesheet": datesheet_data,
-                            "fees": fees_data
-                        },
-                        "scraped_at": datetime.now().isoformat()
-                    }
-                
-                
+                if saved_state is None:
+                    page = await context.new_page()
+                    await self.request_filter.attach(page, 'login')
+                    await self._login(context, page, uid, password)
+                    sessions.record_login(uid)
+                    await page.close()
+
+                self._report("scraping")
+                scraped = await self._scrape_sections(context, requested)
+                if len(self.failed) == len(requested):
+                    raise RuntimeError(f"Every section failed: {', '.join(sorted(self.failed))}")
+
+                return {
+                    "status": "success",
+                    "data": {"uid": uid, **scraped},
+                    "timings": self.timings,
+                    "failed": self.failed,
+                    "login": self.login_attempts,
+                    "session_reused": self.session_reused,
+                    "network": self.request_filter.stats(),
+                    "scraped_at": datetime.now().isoformat()
+                }
+
+            except LoginFailed as e:
+                print(f"Login gave up: {e}")
+                return {
+                    "status": "error",
+                    "reason": e.reason,
+                    "message": str(e),
+                    "login": self.login_attempts,
+                    "scraped_at": datetime.now().isoformat()
+                }
             except Exception as e:
                 print(f"Error during data refresh: {e}")
                 return {
@@ -193,17 +143,168 @@ class CUIMSScraper:
                     "scraped_at": datetime.now().isoformat()
                 }
             finally:
-                db.update_last_updated(uid, datetime.now().isoformat())
-                await browser.close()
+                await adb.update_last_updated(uid, datetime.now().isoformat())
     
-    async def _login_first(self, page, uid, password):
+    def _report(self, phase, section=None):
+        if self.progress is not None:
+            self.progress(phase, section)
+        events.init_hub().publish(self.uid, "phase", {"phase": phase, "section": section})
+
+    async def _scrape_sections(self, context, requested) -> Dict:
+        config = get_config()
+        limit = asyncio.Semaphore(config['SCRAPE_CONCURRENCY'])
+        groups = [[name for name in group if name in requested] for group in PAGE_GROUPS]
+        scraped = {}
+        self.http = http_engine.HttpScraper(await context.storage_state())
+
+        async def run_group(group):
+            async with limit:
+                page = None
+                try:
+                    for name in group:
+                        # Later sections in a group read the page the earlier one left behind.
+                        if any(other in self.failed for other in group[:group.index(name)]):
+                            self.failed[name] = "skipped after an earlier section on the same page failed"
+                            continue
+                        with timings.track_section(sections.BUDGET_MS.get(name)) as section_timings:
+                            scraped[name] = None
+                            try:
+                                if sections.engine_for(name, config) == 'http':
+                                    try:
+                                        scraped[name] = await self._scrape_http(name)
+                                        section_timings['engine'] = 'http'
+                                    except Exception as e:
+                                        print(f"HTTP scrape of {name} failed, falling back to browser: {e}")
+                                if scraped[name] is None:
+                                    if page is None:
+                                        page = await context.new_page()
+                                        await self.request_filter.attach(page, group[0])
+                                    scraped[name] = await getattr(self, f"_scrape_{name}")(page)
+                                    section_timings['engine'] = 'browser'
+                                    # The browser scrapers log their own errors and return False.
+                                    if scraped[name] is False or scraped[name] is None:
+                                        raise RuntimeError(f"{name} scraper returned no data")
+                            except Exception as e:
+                                # A dead browser takes every section with it; anything else only costs this one.
+                                if not context.browser or not context.browser.is_connected():
+                                    raise
+                                print(f"Scraping {name} failed: {e}")
+                                self.failed[name] = str(e) or type(e).__name__
+                        self.timings[name] = section_timings
+                        if name in self.failed:
+                            continue
+                        self._report("section_done", name)
+                        print(f"{name.capitalize()} data scraped successfully in {section_timings['total_ms']}ms "
+                              f"({section_timings['wait_ms']}ms waiting, {section_timings['extract_ms']}ms extracting).")
+                finally:
+                    if page is not None:
+                        try:
+                            await page.close()
+                        except PlaywrightError:
+                            pass
+
+        # On a fatal error the siblings are cancelled and awaited before the context closes under them.
+        tasks = [asyncio.create_task(run_group(group)) for group in groups if group]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return scraped
+
+    async def _scrape_http(self, name):
+        if name == 'attendance':
+            tables = await self.http.extract(sections.URLS['attendance'], {'table': sections.ATTENDANCE_TABLE})
+            return tables['table']
+        if name == 'marks':
+            tables = await self.http.extract(sections.URLS['marks'], {'table': sections.MARKS_HTML_TABLE})
+            return self._parse_marks(tables['table'])
+        if name == 'result':
+            tables = await self.http.extract(sections.URLS['result'], sections.RESULT_TABLES)
+            return self._parse_result(tables)
+        if name == 'datesheet':
+            tables = await self.http.extract(sections.URLS['datesheet'], {'table': sections.DATESHEET_TABLE})
+            return tables['table']
+        if name == 'leaves':
+            leaves = []
+            for leave_type in ('duty_leave', 'medical_leave'):
+                tables = await self.http.extract(sections.URLS[leave_type], {'table': sections.LEAVES_TABLE})
+                leaves.append(tables['table'])
+            return leaves
+        if name == 'fees':
+            tables = await self.http.extract(
+                sections.URLS['fees'], {'table': sections.FEES_TABLE}, postback=sections.FEES_POSTBACK
+            )
+            return self._parse_fees(tables['table'])
+        raise ValueError(f"No HTTP scraper for {name}")
+
+    async def _login(self, context, page, uid, password):
+        # Retries wrong captchas and site hiccups with backoff; a wrong password stops at once.
+        for attempt in range(1, self.login_max_attempts + 1):
+            started = time.perf_counter()
+            record = {"attempt": attempt}
+            self.login_attempts.append(record)
+            outcome = await self._login_attempt(page, uid, password, record)
+            record["outcome"] = outcome
+            record["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            print(f"Login attempt {attempt}: {outcome} in {record['total_ms']}ms")
+
+            if outcome == "ok":
+                storage_state = await context.storage_state()
+                await adb.save_session(uid, storage_state)
+                return
+            if outcome == "bad_password":
+                raise LoginFailed(outcome, "CUIMS rejected the user ID or password")
+            if attempt < self.login_max_attempts:
+                delay = min(self.login_backoff_max_s, self.login_backoff_s * 2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(delay / 2, delay))
+
+        outcome = self.login_attempts[-1]["outcome"]
+        if outcome == "site_down":
+            raise LoginFailed(outcome, "CUIMS is not responding, try again later")
+        raise LoginFailed(outcome, f"Could not log in after {self.login_max_attempts} attempts")
+
+    async def _login_attempt(self, page, uid, password, record) -> str:
+        try:
+            async with governor.limit(HOME_URL) as call:
+                response = call.check(await page.goto(HOME_URL, timeout=self.login_nav_timeout_ms))
+            if response is not None and response.status >= 500:
+                return "site_down"
+
+            stage = time.perf_counter()
+            captcha_img = await self._login_first(page, uid)
+            record["captcha_load_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+            if not captcha_img:
+                return "site_down"
+
+            self._report("captcha")
+            stage = time.perf_counter()
+            captcha_txt = await utils.extract_captcha_from_img(captcha_img)
+            record["captcha_solve_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+            if not captcha_txt:
+                return "bad_captcha"
+
+            stage = time.perf_counter()
+            outcome = await self._login_second(page, password, captcha_txt)
+            record["submit_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+            if outcome == "ok":
+                await asyncio.to_thread(captcha_solver.init_solver().record, captcha_img, captcha_txt)
+            return outcome
+        except PlaywrightError as e:
+            print(f"Login attempt failed on a browser error: {e}")
+            return "site_down"
+
+    async def _login_first(self, page, uid):
 
         print("Filling user ID...")
         await page.fill("#txtUserId", uid)
         print("User ID filled successfully.")
 
         print("Clicking next button...")
-        await page.click("#btnNext")
+        async with governor.limit(HOME_URL):
+            await page.click("#btnNext")
         print("Next button clicked successfully.")
 
         try:
@@ -214,15 +315,21 @@ class CUIMSScraper:
 
             print("Taking screenshot of captcha...")
             captcha_bytes = await captcha_element.screenshot()
-            image = Image.open(BytesIO(captcha_bytes))
             print("Captcha screenshot taken successfully.")
-            return image
+            return captcha_bytes
 
         except Exception as e:
             print(f"Error during captcha loading or screenshot: {e}")
             return False
         
-    async def _login_second(self, page,uid: str ,password: str, captcha: str) -> bool:
+    async def _login_second(self, page, password: str, captcha: str) -> str:
+        alerts = []
+
+        async def on_dialog(dialog):
+            alerts.append(dialog.message)
+            await dialog.dismiss()
+
+        page.on("dialog", on_dialog)
         try:
             print("Filling password field...")
             await page.fill("#txtLoginPassword", password)
@@ -233,51 +340,45 @@ class CUIMSScraper:
             print("Captcha field filled successfully.")
 
             print("Clicking login button...")
-            await page.click("#btnLogin")
-            print("Login button clicked successfully.")
-
-            current_url = page.url
-            print(f"Current URL after login attempt: {current_url}")
-
-            if current_url == 'https://students.cuchd.in/StudentHome.aspx':
+            async with governor.limit(HOME_URL) as call:
+                try:
+                    async with page.expect_navigation(wait_until="domcontentloaded", timeout=self.login_nav_timeout_ms) as navigation:
+                        await page.click("#btnLogin")
+                    response = call.check(await navigation.value)
+                except PlaywrightTimeoutError:
+                    # Client-side validation answers with an alert and never navigates.
+                    if not alerts:
+                        call.fail()
+                        return "site_down"
+                    response = None
+            print(f"Current URL after login attempt: {page.url}")
+
+            if page.url == HOME_URL:
                 print("Login successful.")
-                return True
-            else:
-                print("Login failed. Retrying...")
-                time.sleep(10)
-                return False
-            
-        except Exception as e:
-            return False
-    
-    async def _scrape_attendance(self, page) -> list:
+                return "ok"
+            if response is not None and response.status >= 500:
+                return "site_down"
+
+            messages = list(alerts)
+            for element in await page.query_selector_all(LOGIN_ERROR_SELECTOR):
+                messages.append(await element.inner_text())
+            outcome = classify_login_error(" ".join(messages))
+            print(f"Login rejected ({outcome}): {' '.join(messages).strip() or 'no message'}")
+            # Without a message a wrong captcha is by far the most likely cause, so keep retrying.
+            return "bad_captcha" if outcome == "unknown" else outcome
+        finally:
+            page.remove_listener("dialog", on_dialog)
 
-        await page.goto('https://students.cuchd.in/frmStudentCourseWiseAttendanceSummary.aspx?type=etgkYfqBdH1fSfc255iYGw==')
+    async def _scrape_attendance(self, page) -> list:
 
-        await page.wait_for_timeout(2000)  # equivalent of time.sleep(2)
+        await readiness.goto(page, sections.URLS['attendance'])
 
         try:
             # Scroll to bottom to ensure table loads
             await page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
 
-            await page.wait_for_selector("#SortTable", timeout=10000)
-            tbody = await page.query_selector("xpath=//*[@id='SortTable']/tbody")
-            rows = await tbody.query_selector_all("tr")
-
-            attendance_data = []
-
-            for row in rows:
-                tds = await row.query_selector_all("td")
-
-                if len(tds) >= 11:
-                    attendance_dict = {
-                        'Course Code': (await tds[0].text_content()).strip(),
-                        'Title': (await tds[1].text_content()).strip(),
-                        'Eligible Delivered': (await tds[8].text_content()).strip(),
-                        'Eligible Attended': (await tds[9].text_content()).strip(),
-                        'Eligible Percentage': (await tds[10].text_content()).strip()
-                    }
-                    attendance_data.append(attendance_dict)
+            await readiness.wait_ready(page, 'attendance')
+            attendance_data = await dom.extract_table(page, sections.ATTENDANCE_TABLE)
 
             print("Attendance data scraped from webpage.")
             return attendance_data
@@ -288,86 +389,73 @@ class CUIMSScraper:
   
     async def _scrape_timetable(self, page) -> list:
 
-        final_time_table = []
-
         try:
-            timetable = {
-                0: [], 1: [], 2: [], 3: [], 4: [], 5: [], 6: []
-            }
-
             # Wait for the timetable table body
-            await page.wait_for_selector("xpath=//*[@id='ContentPlaceHolder1_grdMain']/tbody", timeout=10000)
-            tbody = await page.query_selector("xpath=//*[@id='ContentPlaceHolder1_grdMain']/tbody")
-            rows = await tbody.query_selector_all("tr")
-
-            for row_index, row in enumerate(rows[1:]):  # skip header
-                cols = await row.query_selector_all("td")
-                for col_index, val in enumerate(cols[1:]):  # skip time column
-                    cell_text = (await val.text_content()).strip()
-
-                    if cell_text:
-                        period_time = (await cols[0].text_content()).strip()
-                        course_data_with_time = f"{cell_text} on {period_time}"
-                        timetable[col_index].append(course_data_with_time)
-
-            for day, val in timetable.items():
-                day_data = []
-                for period in val:
-                    period_data = {}
-                    try:
-                        period_parts = period.split('::')
-                        subject = period_parts[0].split(':')[0]
-
-                        teacher_data = period_parts[1].split("By ")[1].split(" at ")
-                        if len(teacher_data) > 1:
-                            teacher = teacher_data[0]
-                            class_loc = teacher_data[1].split("on")
-                        else:
-                            teacher = ""
-                            class_loc = teacher_data[0].split("at ")[1].split(" on ")
-
-                        period_data['subject_code'] = subject
-                        period_data['teacher'] = teacher
-                        period_data['location'] = class_loc[0]
-                        period_data['time'] = class_loc[1]
-                        period_data['day_number'] = day + 1
-
-                        day_data.append(period_data)
-                    except Exception as e:
-                        continue
-
-                final_time_table.append(day_data)
+            await readiness.wait_ready(page, 'timetable')
+            rows = await dom.extract_table(page, sections.TIMETABLE_TABLE)
 
             print("Timetable data scraped from webpage.")
-            return final_time_table
+            return self._parse_timetable(rows)
 
         except Exception as e:
             print(f"Error scraping timetable data: {e}")
             return False
 
+    def _parse_timetable(self, rows) -> list:
+
+        final_time_table = []
+        timetable = {
+            0: [], 1: [], 2: [], 3: [], 4: [], 5: [], 6: []
+        }
+
+        for cols in rows:
+            for col_index, cell_text in enumerate(cols[1:]):  # skip time column
+                if cell_text:
+                    period_time = cols[0]
+                    course_data_with_time = f"{cell_text} on {period_time}"
+                    timetable[col_index].append(course_data_with_time)
+
+        for day, val in timetable.items():
+            day_data = []
+            for period in val:
+                period_data = {}
+                try:
+                    period_parts = period.split('::')
+                    subject = period_parts[0].split(':')[0]
+
+                    teacher_data = period_parts[1].split("By ")[1].split(" at ")
+                    if len(teacher_data) > 1:
+                        teacher = teacher_data[0]
+                        class_loc = teacher_data[1].split("on")
+                    else:
+                        teacher = ""
+                        class_loc = teacher_data[0].split("at ")[1].split(" on ")
+
+                    period_data['subject_code'] = subject
+                    period_data['teacher'] = teacher
+                    period_data['location'] = class_loc[0]
+                    period_data['time'] = class_loc[1]
+                    period_data['day_number'] = day + 1
+
+                    day_data.append(period_data)
+                except Exception as e:
+                    continue
+
+            final_time_table.append(day_data)
+
+        return final_time_table
+
     async def _scrape_courses(self, page) -> list:
 
-        await page.goto('https://students.cuchd.in/frmMyTimeTable.aspx')
+        await readiness.goto(page, sections.URLS['courses'])
 
         # Scroll to bottom to make sure table loads
         await page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
 
         try:
             # Wait for the table body
-            await page.wait_for_selector("xpath=/html/body/form/div[4]/div[3]/div/div[4]/div/table/tbody", timeout=10000)
-            tbody = await page.query_selector("xpath=/html/body/form/div[4]/div[3]/div/div[4]/div/table/tbody")
-
-            rows = await tbody.query_selector_all("tr")
-            courses = []
-
-            for row in rows[1:]:  # skip header row
-                cols = await row.query_selector_all("td")
-                course_code = (await cols[0].text_content()).strip()
-                course_name = (await cols[1].text_content()).strip()
-                courses.append({
-                    "course_code": course_code,
-                    "course_name": course_name
-                })
+            await readiness.wait_ready(page, 'courses')
+            courses = await dom.extract_table(page, sections.COURSES_TABLE)
 
             print("Courses data scraped from webpage.")
             return courses
@@ -378,267 +466,128 @@ class CUIMSScraper:
 
     async def _scrape_profile(self, page):
 
-        await page.goto('https://students.cuchd.in/frmStudentProfile.aspx')
-
-        personal_info = {}
+        await readiness.goto(page, sections.URLS['profile'])
 
         try:
             # Wait for personal info to load
-            await page.wait_for_selector('.stuProfileData .row')
-
-            personal_rows = await page.query_selector_all('.stuProfileData .row .col-md-5.col-xs-6 .row')
-
-            for row in personal_rows:
-                key_el = await row.query_selector('.col-sm-4')
-                val_el = await row.query_selector('.col-sm-8')
-                if key_el and val_el:
-                    key = (await key_el.inner_text()).strip()
-                    value = (await val_el.inner_text()).strip()
-                    personal_info[key] = value
-
-            # Get Education Info
-            education_info = []
-            try:
-                await page.wait_for_selector('#ContentPlaceHolder1_gvStudentQualification tbody', timeout=3000)
-                rows = await page.query_selector_all('#ContentPlaceHolder1_gvStudentQualification tbody tr')
-                for row in rows[1:]:  # skip header
-                    cols = await row.query_selector_all('td')
-                    if len(cols) >= 5:
-                        education_info.append({
-                            'qualification': await cols[0].inner_text(),
-                            'steram': await cols[1].inner_text(),
-                            'school/college': await cols[2].inner_text(),
-                            'university/board': await cols[3].inner_text(),
-                            'passing_year': await cols[4].inner_text(),
-                        })
-            except:
-                pass
-
-            personal_info['education_info'] = education_info
-
-            # Get Contact Info
-            contact_info = []
-            try:
-                await page.wait_for_selector('#ContentPlaceHolder1_gvStudentContacts tbody', timeout=3000)
-                rows = await page.query_selector_all('#ContentPlaceHolder1_gvStudentContacts tbody tr')
-                for row in rows[1:]:
-                    cols = await row.query_selector_all('td')
-                    if len(cols) >= 5:
-                        contact_info.append({
-                            'contact_type': await cols[0].inner_text(),
-                            'residence': await cols[1].inner_text(),
-                            'office': await cols[2].inner_text(),
-                            'mobile': await cols[3].inner_text(),
-                            'email_id': await cols[4].inner_text(),
-                        })
-            except:
-                pass
-
-            personal_info['contact_info'] = contact_info
+            await readiness.wait_ready(page, 'profile')
+            tables = await dom.extract_tables(page, sections.PROFILE_TABLES)
 
             print("Profile data scraped from webpage.")
-            return personal_info
+            return self._parse_profile(tables)
 
         except Exception as e:
             print(f"Error scraping profile data: {e}")
             return False
 
+    def _parse_profile(self, tables) -> dict:
+        personal_info = {
+            row['key']: row['value']
+            for row in tables['personal']
+            if row['key'] is not None and row['value'] is not None
+        }
+        personal_info['education_info'] = tables['education_info']
+        personal_info['contact_info'] = tables['contact_info']
+        return personal_info
+
     async def _scrape_marks(self, page):
         
         try:
 
-            await page.goto('https://students.cuchd.in/frmStudentMarksView.aspx')
-
-            subjects = {}
-
-            headers = await page.query_selector_all(".ui-accordion-header")
-
-            for i, header in enumerate(headers):
-                subject_text = (await header.inner_text()).strip()
-                subjects[subject_text] = {"experiments": []}
-
-                if i != 0:
-                    await header.click()
-                    await page.wait_for_timeout(1000)  # 1 sec wait after clicking
-
-                panel_id = await header.get_attribute("aria-controls")
-                panel = await page.query_selector(f"#{panel_id}")
+            await readiness.goto(page, sections.URLS['marks'])
+            await readiness.wait_ready(page, 'marks')
 
-                rows = await panel.query_selector_all("tbody tr")
-
-                for row in rows:
-                    cols = await row.query_selector_all("td")
-                    if len(cols) == 3:
-                        subjects[subject_text]["experiments"].append({
-                            "name": (await cols[0].inner_text()).strip(),
-                            "max_marks": (await cols[1].inner_text()).strip(),
-                            "marks_obtained": (await cols[2].inner_text()).strip()
-                        })
+            # Collapsed accordion panels are still in the DOM, so no need to open each one.
+            headers = await dom.extract_table(page, sections.MARKS_TABLE)
 
             print("Marks data scraped from webpage.")
-            return subjects
-        except:
-            print("Error scraping marks data.")
-            return {}
+            return self._parse_marks(headers)
+        except Exception as e:
+            print(f"Error scraping marks data: {e}")
+            return False
+
+    def _parse_marks(self, headers) -> dict:
+        return {
+            header['subject']: {"experiments": header['experiments']}
+            for header in headers
+        }
    
     async def _scrape_fees(self, page):
-        await page.goto("https://students.cuchd.in/frmAccountStudentDetails.aspx")
+        await readiness.goto(page, sections.URLS['fees'])
         
         try:
             # Click the 2nd tab (Payment History)
-            tab = await page.wait_for_selector(
-                '#ctl00_ContentPlaceHolder1_RadTabStrip1 > div > ul > li:nth-child(2) > a > span > span > span',
-                timeout=5000
-            )
-            await tab.click()
-            await page.wait_for_timeout(1500)
+            await readiness.wait_ready(page, 'fees')
+            async with governor.limit(sections.URLS['fees']):
+                await page.click(sections.READY['fees'][0]['selector'], timeout=max(1, timings.remaining_ms()))
+            await readiness.wait_ready(page, 'fees_history')
 
-            payments = []
-            
-            # Select all transaction blocks (each wrapped in a div)
-            transaction_divs = await page.query_selector_all("div[style*='border-bottom: 1px solid']")
-
-            for trans_div in transaction_divs:
-                trans_detail = {}
-
-                # Date
-                date_div = await trans_div.query_selector(".transactions-date")
-                month_div = await trans_div.query_selector(".transactions-month")
-                if date_div and month_div:
-                    trans_detail["payment_date"] = f"{await date_div.inner_text()} {await month_div.inner_text()}"
-
-                # Get all <span> values inside the details table
-                table = await trans_div.query_selector("table")
-                tds = await table.query_selector_all("td")
-
-                if len(tds) >= 4:
-                    # 2nd TD = REF NOs and mode
-                    spans = await tds[1].query_selector_all("span")
-                    if len(spans) >= 6:
-                        trans_detail["trans_ref_no"] = await spans[1].inner_text()
-                        trans_detail["bank_ref_no"] = await spans[3].inner_text()
-                        trans_detail["payment_mode"] = await spans[5].inner_text()
-
-                    # 3rd TD = Amounts
-                    amounts = await tds[2].query_selector_all("div")
-                    if len(amounts) >= 3:
-                        trans_detail["total_amt"] = (await amounts[0].inner_text()).split("Rs")[-1].strip()
-                        trans_detail["service_tax"] = (await amounts[1].inner_text()).split("Rs")[-1].strip()
-                        trans_detail["processing_fee"] = (await amounts[2].inner_text()).split("Rs")[-1].strip()
-
-                    # 4th TD = status
-                    trans_detail["status"] = (await tds[3].inner_text()).strip()
-
-                    payments.append(trans_detail)
+            transactions = await dom.extract_table(page, sections.FEES_TABLE)
 
             print("Fees data scraped from webpage.")
-            return payments
+            return self._parse_fees(transactions)
 
         except Exception as e:
             print(f"Error scraping fees data: {e}")
             return False
+
+    def _parse_fees(self, transactions) -> list:
+        payments = []
+        for trans in transactions:
+            trans_detail = {}
+            if trans['date'] is not None and trans['month'] is not None:
+                trans_detail["payment_date"] = f"{trans['date']} {trans['month']}"
+            if trans['payment_mode'] is not None:
+                trans_detail["trans_ref_no"] = trans['trans_ref_no']
+                trans_detail["bank_ref_no"] = trans['bank_ref_no']
+                trans_detail["payment_mode"] = trans['payment_mode']
+            if trans['processing_fee'] is not None:
+                trans_detail["total_amt"] = trans['total_amt'].split("Rs")[-1].strip()
+                trans_detail["service_tax"] = trans['service_tax'].split("Rs")[-1].strip()
+                trans_detail["processing_fee"] = trans['processing_fee'].split("Rs")[-1].strip()
+            trans_detail["status"] = trans['status']
+            payments.append(trans_detail)
+        return payments
   
     async def _scrape_result(self, page):
 
         try:
-            await page.goto("https://students.cuchd.in/result.aspx")
-            await page.wait_for_timeout(2000)
+            await readiness.goto(page, sections.URLS['result'])
+            await readiness.wait_ready(page, 'result')
 
-            result = {}
-
-            # DEBUG: Dump HTML to check selectors if needed
-            html = await page.content()
-            
-
-            try:
-                # Try to get CGPA using a safer selector
-                cgpa_elem = await page.query_selector("div[id$='divCGPA'] span")
-                if cgpa_elem:
-                    result['cgpa'] = await cgpa_elem.inner_text()
-                else:
-                    result['cgpa'] = "N/A"
-
-                result['semester_wise_result'] = []
-
-                sem_tables = await page.query_selector_all("table[id$='dlResult'] > tbody > tr")
-                for i in range(len(sem_tables)):
-                    semester_res = {}
-
-                    sem_title = await page.query_selector(f"#ContentPlaceHolder1_wucResult1_dlResult_lblSem_{i}")
-                    semester_res['semester'] = await sem_title.inner_text() if sem_title else f"Semester {i+1}"
-
-                    sgpa_text = await page.query_selector(
-                        f"#ContentPlaceHolder1_wucResult1_dlResult_div_sticky_{i} > span:nth-child(3)"
-                    )
-                    semester_res['sgpa'] = (await sgpa_text.inner_text()).split(":")[1].strip() if sgpa_text else "N/A"
-
-                    semester_res['semester_result'] = []
-
-                    subject_rows = await page.query_selector_all(
-                        f"#ContentPlaceHolder1_wucResult1_dlResult_Repeater1_{i} > tbody > tr"
-                    )
-
-                    for row in subject_rows[1:]:  # Skip header
-                        cols = await row.query_selector_all("td")
-                        if len(cols) >= 4:
-                            sem_res_value = {
-                                'subject_code': await cols[0].inner_text(),
-                                'subject_name': await cols[1].inner_text(),
-                                'subject_credits': await cols[2].inner_text(),
-                                'subject_grade_ob': await cols[3].inner_text()
-                            }
-                            semester_res['semester_result'].append(sem_res_value)
-
-                    result['semester_wise_result'].append(semester_res)
-
-            except Exception as e:
-                result['semester_wise_result'] = []
+            tables = await dom.extract_tables(page, sections.RESULT_TABLES)
 
             print("Result data scraped from webpage.")
-            return result
+            return self._parse_result(tables)
 
         except Exception as e:
             print(f"Error scraping result data: {e}")
             return False
+
+    def _parse_result(self, tables) -> dict:
+        cgpa = tables['cgpa'][0]['value'] if tables['cgpa'] else None
+        result = {
+            'cgpa': cgpa if cgpa is not None else "N/A",
+            'semester_wise_result': []
+        }
+
+        for i, semester in enumerate(tables['semesters']):
+            sgpa = semester['sgpa']
+            result['semester_wise_result'].append({
+                'semester': semester['semester'] if semester['semester'] is not None else f"Semester {i+1}",
+                'sgpa': sgpa.split(":")[1].strip() if sgpa and ":" in sgpa else "N/A",
+                'semester_result': semester['subjects']
+            })
+
+        return result
       
     async def _scrape_datesheet(self, page):
 
         try:
-            await page.goto('https://students.cuchd.in/frmStudentDatesheet.aspx')
-            await page.wait_for_timeout(2000)
+            await readiness.goto(page, sections.URLS['datesheet'])
+            await readiness.wait_ready(page, 'datesheet')
 
-            datesheet = []
-
-            try:
-                rows = await page.query_selector_all('table tbody tr')
-
-                for row in rows[1:]:  # Skip table header
-                    cells = await row.query_selector_all('td')
-                    if len(cells) < 10:
-                        continue  # Just in case
-
-                    row_data = {
-                        'exam_type': await cells[0].inner_text(),
-                        'datesheet_type': await cells[1].inner_text(),
-                        'course_code': await cells[2].inner_text(),
-                        'course_name': await cells[3].inner_text(),
-                        'slot_no': await cells[4].inner_text(),
-                        'exam_date': await cells[7].inner_text(),
-                        'exam_time': await cells[8].inner_text(),
-                    }
-
-                    # Check for anchor tag in exam venue
-                    venue_links = await cells[9].query_selector_all("a")
-                    if venue_links:
-                        row_data['exam_venue'] = await venue_links[0].get_attribute('href')
-                    else:
-                        row_data['exam_venue'] = await cells[9].inner_text()
-
-                    datesheet.append(row_data)
-
-            except Exception as e:
-                print(f"Error parsing datesheet rows: {e}")
-                return datesheet
+            datesheet = await dom.extract_table(page, sections.DATESHEET_TABLE)
 
             print("Datesheet data scraped from webpage.")
             return datesheet
@@ -650,139 +599,76 @@ class CUIMSScraper:
     async def _scrape_leaves(self, page):
         leaves = []
 
-        # --- DUTY LEAVE ---
-        try:
-            await page.goto('https://students.cuchd.in/frmStudentApplyDutyLeave.aspx')
-            await page.wait_for_timeout(2000)
-
-            tab = await page.query_selector('#__tab_Tab3')
-            if tab:
-                await tab.click()
-                await page.wait_for_timeout(1500)
-
-            dl_rows = await page.query_selector_all('table tbody tr')
-            dl = []
-
-            for row in dl_rows[1:]:  # Skip header
-                cells = await row.query_selector_all('td')
-                if len(cells) < 8:
-                    continue
-
-                dl_info = {
-                    'dl_number': await cells[1].inner_text(),
-                    'dl_timing': await cells[2].inner_text(),
-                    'dl_category': await cells[3].inner_text(),
-                    'dl_type': await cells[5].inner_text(),
-                    'dl_date': await cells[6].inner_text(),
-                    'dl_status': await cells[7].inner_text()
-                }
-
-                dl.append(dl_info)
-            leaves.append(dl)
-            print("Duty leave data scraped successfully.")
-        except Exception as e:
-            leaves.append([])
-            print(f"Error scraping duty leave data: {e}")
-
-        # --- MEDICAL LEAVE ---
-        try:
-            await page.goto('https://students.cuchd.in/frmStudentMedicalLeaveApply.aspx')
-            await page.wait_for_timeout(2000)
-
-            tab = await page.query_selector('#__tab_Tab3')
-            if tab:
-                await tab.click()
-                await page.wait_for_timeout(1500)
-
-            ml_rows = await page.query_selector_all('table tbody tr')
-            ml = []
-
-            for row in ml_rows[1:]:
-                cells = await row.query_selector_all('td')
-                if len(cells) < 8:
-                    continue
-
-                ml_info = {
-                    'dl_number': await cells[1].inner_text(),
-                    'dl_timing': await cells[2].inner_text(),
-                    'dl_category': await cells[3].inner_text(),
-                    'dl_type': await cells[5].inner_text(),
-                    'dl_date': await cells[6].inner_text(),
-                    'dl_status': await cells[7].inner_text()
-                }
-
-                ml.append(ml_info)
-            leaves.append(ml)
-            print("Medical leave data scraped successfully.")
-        except Exception as e:
-            leaves.append([])
-            print(f"Error scraping medical leave data: {e}")
+        for leave_type, label in (('duty_leave', 'Duty'), ('medical_leave', 'Medical')):
+            try:
+                await readiness.goto(page, sections.URLS[leave_type])
+                await readiness.wait_ready(page, 'leaves')
+
+                tab = await page.query_selector('#__tab_Tab3')
+                if tab:
+                    # The tab click is a postback to CUIMS, so it goes through the governor like the fees tab.
+                    async with governor.limit(sections.URLS[leave_type]):
+                        await tab.click()
+                    await readiness.wait_ready(page, 'leaves_tab')
+
+                leaves.append(await dom.extract_table(page, sections.LEAVES_TABLE))
+                print(f"{label} leave data scraped successfully.")
+            except Exception as e:
+                leaves.append([])
+                print(f"Error scraping {label.lower()} leave data: {e}")
 
         return leaves
     
               
-async def refresh_user_data(uid: str, password: str, data_to_be_fetched: str) -> Dict:
+async def refresh_user_data(uid: str, password: str, data_to_be_fetched: str, progress=None) -> Dict:
         scraper = CUIMSScraper()
 
-        scraped_data = await scraper.scrape_user_data(uid,password, data_to_be_fetched)
+        scraped_data = await scraper.scrape_user_data(uid,password, data_to_be_fetched, progress)
         
         if scraped_data["status"] == "success":
             data = scraped_data["data"]
+            scraper._report("saving")
             
-            # Initial data fetch updates multiple aspects
-            if data_to_be_fetched == "initial":
-                print('data-fetch-initial')
-                if data.get('attendance'):
-                    attendace_goal = db.get_attendance_goal(data['uid'])
-                    attendance_transformed = utils.transform_attendance(data['attendance'], attendace_goal)
-                    db.update_attendance(data['uid'], attendance_transformed)
-                if data.get('courses'):
-                    db.update_courses(data['uid'], data['courses'])
-                if data.get('timetable'):
-                    db.update_timetable(data['uid'], data['timetable'])
-            
-            elif data_to_be_fetched == 'marks' and data.get('marks'):
-                db.update_marks(data['uid'], data['marks'])
-            elif data_to_be_fetched == 'profile' and data.get('profile'):
-                db.update_profile(data['uid'], data['profile'])
-            elif data_to_be_fetched == 'result' and data.get('result'):
-                db.update_result(data['uid'], data['result'])
-            elif data_to_be_fetched == 'leaves' and data.get('leaves'):
-                db.update_leaves(data['uid'], data['leaves'])
-            elif data_to_be_fetched == 'datesheet' and data.get('datesheet'):
-                db.update_datesheet(data['uid'], data['datesheet'])
-            elif data_to_be_fetched == 'fees' and data.get('fees'):
-                db.update_fees(data['uid'], data['fees'])
-            
-            elif data_to_be_fetched == 'all':
-                if data.get('attendance'):
-                    attendace_goal = db.get_attendance_goal(data['uid'])
-                    attendance_transformed = utils.transform_attendance(data['attendance'], attendace_goal)
-                    db.update_attendance(data['uid'], attendance_transformed)
-                if data.get('courses'):
-                    db.update_courses(data['uid'], data['courses'])
-                if data.get('timetable'):
-                    db.update_timetable(data['uid'], data['timetable'])
-                if data.get('marks'):
-                    db.update_marks(data['uid'], data['marks'])
-                if data.get('profile'):
-                    db.update_profile(data['uid'], data['profile'])
-                if data.get('result'):
-                    db.update_result(data['uid'], data['result'])
-                if data.get('leaves'):
-                    db.update_leaves(data['uid'], data['leaves'])
-                if data.get('datesheet'):
-                    db.update_datesheet(data['uid'], data['datesheet'])
-                if data.get('fees'):
-                    db.update_fees(data['uid'], data['fees'])
-
-            db.update_last_updated(uid, datetime.now().isoformat())
+            # Each writer skips the write when the section's content hash is unchanged.
+            writers = {
+                'attendance': adb.update_attendance,
+                'courses': adb.update_courses,
+                'timetable': adb.update_timetable,
+                'marks': adb.update_marks,
+                'profile': adb.update_profile,
+                'result': adb.update_result,
+                'leaves': adb.update_leaves,
+                'datesheet': adb.update_datesheet,
+                'fees': adb.update_fees,
+            }
+            changed, versions = [], {}
+            for name in REFRESH_MODES[data_to_be_fetched]:
+                value = data.get(name)
+                if not value:
+                    continue
+                if name == 'attendance':
+                    attendace_goal = await adb.get_attendance_goal(data['uid'])
+                    value = utils.transform_attendance(value, attendace_goal)
+                versions[name], written = await writers[name](data['uid'], value)
+                if written:
+                    changed.append(name)
+            print(f"Sections changed for {uid}: {changed or 'none'}")
+
+            await adb.update_last_updated(uid, datetime.now().isoformat())
+            scraper._report("saved")
 
             return {
                 "status": "success",
                 "message": f"{data_to_be_fetched} data refreshed successfully",
+                "changed": changed,
+                "versions": versions,
+                "timings": scraped_data["timings"],
+                "failed": scraped_data["failed"],
+                "login": scraped_data["login"],
+                "network": scraped_data["network"],
                 "updated_at": datetime.now().isoformat()
             }
         else:
+            scraper._report("failed")
             return scraped_data
 
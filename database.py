@@ -1,16 +1,214 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring, ASCENDING
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure, DuplicateKeyError
 from config import get_config
-from datetime import datetime
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import contextvars
+import hashlib
+import json
+import os
+import socket
+from cache import TTLCache, MISSING
+from bson import ObjectId
+import attendance
 
+client = None
 db = None
+cache = None
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Called as listener(uid, section) whenever a cached section is invalidated, on this worker or via another.
+invalidation_listeners = []
+
+# Set per request to a {'count': n} dict so handlers can report how many commands they sent.
+round_trips = contextvars.ContextVar('db_round_trips', default=None)
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    def started(self, event):
+        counter = round_trips.get()
+        if counter is not None:
+            counter['count'] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+SECTIONS = ['attendance', 'timetable', 'courses', 'profile', 'marks', 'datesheet', 'result', 'leaves', 'fees']
+
+UID_COLLECTIONS = [
+    'users', 'new_user', 'sessions', 'session_first', 'attendance', 'timetable', 'courses',
+    'profile', 'marks', 'datesheet', 'result', 'leaves', 'fees'
+]
 
 def init_db():
-    global db
+    global client, db, cache
+    if client is not None:
+        return
     load_dotenv()
     config = get_config()
-    client = MongoClient(config['MONGO_URI'])
+    client = MongoClient(
+        config['MONGO_URI'],
+        maxPoolSize=config['DB_POOL_SIZE'],
+        minPoolSize=config['DB_MIN_POOL_SIZE'],
+        maxIdleTimeMS=config['DB_MAX_IDLE_TIME_MS'],
+        connectTimeoutMS=config['DB_CONNECT_TIMEOUT_MS'],
+        serverSelectionTimeoutMS=config['DB_SERVER_SELECTION_TIMEOUT_MS'],
+        event_listeners=[RoundTripCounter()]
+    )
     db = client['users']
+    if cache is None:
+        cache = TTLCache(
+            max_entries=config['CACHE_MAX_ENTRIES'],
+            max_bytes=config['CACHE_MAX_MB'] * 1024 * 1024,
+            ttl_s=config['CACHE_TTL_S']
+        )
+
+def close_db():
+    global client, db
+    if client is not None:
+        client.close()
+        client = None
+        db = None
+
+def ensure_indexes():
+    # Idempotent: create_index is a no-op when an identical index already exists.
+    config = get_config()
+    for name in UID_COLLECTIONS:
+        try:
+            db[name].create_index([('uid', ASCENDING)], unique=True, name='uid_unique')
+        except OperationFailure as e:
+            print(f"Could not create unique uid index on {name}: {e}")
+    _ensure_ttl_index('new_user', 'created_at', config['NEW_USER_TTL_S'])
+    _ensure_ttl_index('session_first', 'updated_at', config['SESSION_FIRST_TTL_S'])
+    _ensure_ttl_index('cache_invalidations', 'created_at', 3600)
+    _ensure_ttl_index('leases', 'expires_at', 0)
+
+def _ensure_ttl_index(collection, field, ttl_s):
+    # create_index refuses to change expireAfterSeconds on an existing index, so a changed TTL goes through collMod.
+    name = f'{field}_ttl'
+    existing = db[collection].index_information().get(name)
+    if existing is None:
+        db[collection].create_index(field, expireAfterSeconds=ttl_s, name=name)
+    elif existing.get('expireAfterSeconds') != ttl_s:
+        db.command('collMod', collection, index={'name': name, 'expireAfterSeconds': ttl_s})
+        print(f"Changed TTL of {collection}.{name} to {ttl_s}s")
+
+def _cached(uid, section, load):
+    value = cache.get((uid, section))
+    if value is MISSING:
+        generation = cache.generation((uid, section))
+        value = load()
+        cache.set((uid, section), value, generation)
+    return value
+
+def peek(uid, section):
+    return cache.get((uid, section))
+
+def invalidate(uid, section, broadcast=True):
+    cache.invalidate((uid, section))
+    for listener in invalidation_listeners:
+        listener(uid, section)
+    if broadcast and get_config()['CACHE_INVALIDATION_CHANNEL'] == 'mongo':
+        # created_at comes from the server clock, so every worker's records share one time line.
+        db['cache_invalidations'].update_one(
+            {'_id': ObjectId()},
+            {'$set': {'uid': uid, 'section': section, 'worker': WORKER_ID}, '$currentDate': {'created_at': True}},
+            upsert=True
+        )
+
+INVALIDATION_OVERLAP_S = 30
+
+def poll_invalidations(state=None):
+    # Applies invalidations published by other workers and returns the state for the next poll.
+    # ObjectIds are minted client side and don't sort across workers, so the cursor is the server
+    # timestamp, re-read with an overlap (a write can become visible after a later one) and
+    # deduplicated on _id. Starting from the server's current time, not the newest record, means an
+    # empty collection at startup or after the TTL cannot swallow the next invalidation.
+    if state is None:
+        return {'since': client.admin.command('hello')['localTime'].replace(tzinfo=None), 'seen': {}}
+    since, seen = state['since'], state['seen']
+    query = {
+        'worker': {'$ne': WORKER_ID},
+        'created_at': {'$gte': since - timedelta(seconds=INVALIDATION_OVERLAP_S)}
+    }
+    for record in db['cache_invalidations'].find(query).sort('created_at', 1):
+        since = max(since, record['created_at'])
+        if record['_id'] in seen:
+            continue
+        seen[record['_id']] = record['created_at']
+        invalidate(record['uid'], record['section'], broadcast=False)
+    horizon = since - timedelta(seconds=INVALIDATION_OVERLAP_S)
+    return {'since': since, 'seen': {_id: at for _id, at in seen.items() if at >= horizon}}
+
+def content_hash(data):
+    # Stable across runs and key order, so an identical scrape always hashes the same.
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()[:16]
+
+def get_version(uid, section):
+    def load():
+        doc = db[section].find_one({'uid': uid}, {'version': 1})
+        return doc.get('version') if doc else None
+    return _cached(uid, f'{section}_version', load)
+
+def _write_section(uid, section, data):
+    # Returns (version, changed); identical data is never rewritten.
+    version = content_hash(data)
+    if get_version(uid, section) == version:
+        return version, False
+    db[section].update_one(
+        {'uid': uid},
+        {'$set': {section: data, 'version': version}},
+        upsert=True
+    )
+    invalidate(uid, section)
+    invalidate(uid, f'{section}_version')
+    return version, True
+
+def acquire_lease(kind, uid, token, ttl_s, owner_url=''):
+    # Only a free or expired lease can be taken, even by this worker; each holder renews and
+    # releases with its own token. A live holder makes the upsert hit the unique _id.
+    now = datetime.utcnow()
+    try:
+        db['leases'].find_one_and_update(
+            {'_id': f'{kind}:{uid}', 'expires_at': {'$lt': now}},
+            {'$set': {
+                'owner': WORKER_ID,
+                'owner_url': owner_url,
+                'token': token,
+                'expires_at': now + timedelta(seconds=ttl_s),
+                'renewed_at': now
+            }},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return True
+    except DuplicateKeyError:
+        return False
+
+def renew_lease(kind, uid, token, ttl_s):
+    now = datetime.utcnow()
+    result = db['leases'].update_one(
+        {'_id': f'{kind}:{uid}', 'token': token},
+        {'$set': {'expires_at': now + timedelta(seconds=ttl_s), 'renewed_at': now}}
+    )
+    return result.matched_count == 1
+
+def release_lease(kind, uid, token):
+    db['leases'].delete_one({'_id': f'{kind}:{uid}', 'token': token})
+
+def get_lease(kind, uid):
+    return db['leases'].find_one({'_id': f'{kind}:{uid}', 'expires_at': {'$gte': datetime.utcnow()}})
+
+def get_lease_holders(kind):
+    # uids with a live lease of this kind, for callers that would otherwise ask one uid at a time.
+    prefix = f'{kind}:'
+    leases = db['leases'].find({'_id': {'$regex': f'^{prefix}'}, 'expires_at': {'$gte': datetime.utcnow()}}, {'_id': 1})
+    return [lease['_id'][len(prefix):] for lease in leases]
 
 def get_user(uid):
     users = db['users']
@@ -21,7 +219,7 @@ def insert_new_user(uid):
     collection = db['new_user']
     collection.update_one(
         {"uid": uid},              
-        {"$setOnInsert": {"uid": uid}}, 
+        {"$setOnInsert": {"uid": uid, "created_at": datetime.utcnow()}}, 
         upsert=True
     )
 
@@ -30,6 +228,16 @@ def get_user_by_uid(uid: str):
     user = users.find_one({'uid': uid})
     return user
 
+def get_token_version(uid: str):
+    def load():
+        user = db['users'].find_one({'uid': uid}, {'token_version': 1})
+        return user.get('token_version', 0) if user else None
+    return _cached(uid, 'token_version', load)
+
+def revoke_tokens(uid: str):
+    db['users'].update_one({'uid': uid}, {'$inc': {'token_version': 1}})
+    invalidate(uid, 'token_version')
+
 def create_user_document(username: str, hashed_password: str):
     users = db['users']
     users.update_one(
@@ -42,63 +250,116 @@ def create_user_document(username: str, hashed_password: str):
         }}, 
         upsert=True
         )
+    invalidate(username, 'token_version')
+
+def get_page_data(uid: str, fields: list):
+    page = {'uid': uid}
+    missing = []
+    generations = {}
+    for field in ['goal'] + list(fields):
+        value = cache.get((uid, field))
+        if value is MISSING:
+            missing.append(field)
+            generations[field] = cache.generation((uid, field))
+        else:
+            page[field] = value
+    if not missing:
+        return page
+
+    # One aggregation: the user document plus each missing section joined in by uid.
+    pipeline = [{'$match': {'uid': uid}}, {'$limit': 1}]
+    projection = {'_id': 0, 'uid': 1, 'goal': 1}
+    for field in missing:
+        if field == 'goal':
+            continue
+        # `<section>_version` fields read the content hash stored next to the section.
+        if field == 'last_updated':
+            collection, path = 'sessions', field
+        elif field.endswith('_version'):
+            collection, path = field[:-len('_version')], 'version'
+        else:
+            collection, path = field, field
+        pipeline.append({'$lookup': {
+            'from': collection,
+            'localField': 'uid',
+            'foreignField': 'uid',
+            'as': f'_{field}'
+        }})
+        projection[field] = {'$arrayElemAt': [f'$_{field}.{path}', 0]}
+    pipeline.append({'$project': projection})
+    docs = list(db['users'].aggregate(pipeline))
+    if not docs:
+        return None
 
-def get_attendance(uid : str):
-    attendance_db = db['attendance']
-    attendance_data = attendance_db.find_one({'uid': uid})
-    return attendance_data['attendance']
+    doc = docs[0]
+    doc.setdefault('goal', 75)
+    for field in missing:
+        if field in doc:
+            cache.set((uid, field), doc[field], generations[field])
+            page[field] = doc[field]
+    return page
 
-def get_timetable(uid : str):
-    timetable_db = db['timetable']
-    timetable_data = timetable_db.find_one({'uid': uid})
-    return timetable_data['timetable']
+def get_attendance(uid: str):
+    return _cached(uid, 'attendance', lambda: db['attendance'].find_one({'uid': uid})['attendance'])
+
+def get_timetable(uid: str):
+    return _cached(uid, 'timetable', lambda: db['timetable'].find_one({'uid': uid})['timetable'])
 
 def get_courses(uid: str):
-    courses_db = db['courses']
-    courses_data = courses_db.find_one({'uid':uid})
-    return courses_data['courses']
+    return _cached(uid, 'courses', lambda: db['courses'].find_one({'uid': uid})['courses'])
 
 def update_attendance(uid: str, attendance_data):
-    attendance_db = db['attendance']
-    attendance_db.update_one(
-        {'uid': uid},
-        {'$set': {'attendance': attendance_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'attendance', attendance_data)
 
 def update_timetable(uid: str, timetable_data):
-    timetable_db = db['timetable']
-    timetable_db.update_one(
-        {'uid': uid},
-        {'$set': {'timetable': timetable_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'timetable', timetable_data)
 
 def update_courses(uid: str, courses_data):
-    courses_db = db['courses']
-    courses_db.update_one(
-        {'uid': uid},
-        {'$set': {'courses': courses_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'courses', courses_data)
 
 def save_session(uid, storage_state):
     sessions = db['sessions']
+    now = datetime.utcnow()
     sessions.update_one(
         {"uid": uid},
-        {"$set": {"storage": storage_state}},
+        # A successful CUIMS login proves the stored password works again.
+        {"$set": {"storage": storage_state, "saved_at": now, "checked_at": now}, "$inc": {"logins": 1},
+         "$unset": {"refresh_blocked": ""}},
         upsert=True
     )
 
 def load_session(uid):
-    sessions = db['sessions']
-    record = sessions.find_one({"uid": uid})
+    record = load_session_record(uid)
     return record.get("storage") if record else None
 
+def load_session_record(uid):
+    sessions = db['sessions']
+    return sessions.find_one({"uid": uid}, {"storage": 1, "saved_at": 1, "checked_at": 1})
+
+def touch_session(uid, reused=False):
+    # Records a successful validity probe; `reused` counts refreshes that skipped the captcha login.
+    update = {"$set": {"checked_at": datetime.utcnow()}}
+    if reused:
+        update["$inc"] = {"reuses": 1}
+    db['sessions'].update_one({"uid": uid}, update)
+
+def get_refresh_states():
+    # Every user's last refresh time, for the staleness scheduler.
+    return list(db['sessions'].find(
+        {'last_updated': {'$exists': True}, 'refresh_blocked': {'$exists': False}},
+        {'_id': 0, 'uid': 1, 'last_updated': 1}
+    ))
+
+def block_refresh(uid, reason):
+    # Keeps background refreshes away from this user until save_session records a good login.
+    db['sessions'].update_one({'uid': uid}, {'$set': {'refresh_blocked': {'reason': reason, 'at': datetime.utcnow()}}})
+
+def get_refresh_state(uid):
+    # Uncached on purpose: another worker may have refreshed this user a moment ago.
+    return db['sessions'].find_one({'uid': uid}, {'_id': 0, 'last_updated': 1})
+
 def get_last_updated(uid):
-    users = db['sessions']
-    last_updated = users.find_one({'uid' : uid})
-    return last_updated['last_updated']
+    return _cached(uid, 'last_updated', lambda: db['sessions'].find_one({'uid': uid})['last_updated'])
 
 def update_last_updated(uid, msg):
     users = db['sessions']
@@ -106,102 +367,77 @@ def update_last_updated(uid, msg):
         {'uid': uid},
         {"$set": {"last_updated": msg}}
         )
+    invalidate(uid, 'last_updated')
 
 def update_profile(uid: str, profile_data):
-    profile_db = db['profile']
-    profile_db.update_one(
-        {'uid': uid},
-        {'$set': {'profile': profile_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'profile', profile_data)
 
 def update_marks(uid: str, marks_data):
-    marks_db = db['marks']
-    marks_db.update_one(
-        {'uid': uid},
-        {'$set': {'marks': marks_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'marks', marks_data)
 
 def update_datesheet(uid: str, datesheet_data):
-    datesheet_db = db['datesheet']
-    datesheet_db.update_one(
-        {'uid': uid},
-        {'$set': {'datesheet': datesheet_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'datesheet', datesheet_data)
 
 def update_result(uid: str, result_data):
-    result_db = db['result']
-    result_db.update_one(
-        {'uid': uid},
-        {'$set': {'result': result_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'result', result_data)
 
 def update_leaves(uid: str, leaves_data):
-    leaves_db = db['leaves']
-    leaves_db.update_one(
-        {'uid': uid},
-        {'$set': {'leaves': leaves_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'leaves', leaves_data)
 
 def update_fees(uid: str, fees_data):
-    fees_db = db['fees']
-    fees_db.update_one(
-        {'uid': uid},
-        {'$set': {'fees': fees_data}},
-        upsert=True
-    )
+    return _write_section(uid, 'fees', fees_data)
 
 def get_marks(uid: str):
-    marks_db = db["marks"]
-    data = marks_db.find_one({"uid": uid})
-    return data["marks"]
+    return _cached(uid, 'marks', lambda: db['marks'].find_one({'uid': uid})['marks'])
 
 def get_result(uid: str):
-    result_db = db["result"]
-    data = result_db.find_one({"uid": uid})
-    return data["result"]
+    return _cached(uid, 'result', lambda: db['result'].find_one({'uid': uid})['result'])
 
 def get_profile(uid: str):
-    profile_db = db["profile"]
-    data = profile_db.find_one({"uid": uid})
-    return data["profile"]
+    return _cached(uid, 'profile', lambda: db['profile'].find_one({'uid': uid})['profile'])
 
 def get_leaves(uid: str):
-    leaves_db = db["leaves"]
-    data = leaves_db.find_one({"uid": uid})
-    return data["leaves"]
+    return _cached(uid, 'leaves', lambda: db['leaves'].find_one({'uid': uid})['leaves'])
 
 def get_fees(uid: str):
-    fees_db = db["fees"]
-    data = fees_db.find_one({"uid": uid})
-    return data["fees"]
+    return _cached(uid, 'fees', lambda: db['fees'].find_one({'uid': uid})['fees'])
 
 def get_datesheet(uid: str):
-    datesheet_db = db["datesheet"]
-    data = datesheet_db.find_one({"uid": uid})
-    return data["datesheet"]
+    return _cached(uid, 'datesheet', lambda: db['datesheet'].find_one({'uid': uid})['datesheet'])
 
 def get_attendance_goal(uid: str):
-    users = db['users']
-    user = users.find_one({"uid": uid})
-    try:
-        return user['goal']
-    except:
-        return 75
+    def load():
+        user = db['users'].find_one({"uid": uid}, {'goal': 1})
+        try:
+            return user['goal']
+        except:
+            return 75
+    return _cached(uid, 'goal', load)
 
 def set_goal_value(uid: str, goal: int):
     users = db['users']
     users.update_one({"uid": uid}, {"$set": {"goal": goal}}, upsert=True)
+    invalidate(uid, 'goal')
     
+def recompute_attendance(uids=None):
+    # Re-derives every stored projection in one vectorised pass, for a goal change or a new policy.
+    docs = list(db['attendance'].find({} if uids is None else {'uid': {'$in': list(uids)}}, {'_id': 0, 'uid': 1, 'attendance': 1}))
+    goals = {
+        user['uid']: user.get('goal', 75)
+        for user in db['users'].find({'uid': {'$in': [doc['uid'] for doc in docs]}}, {'_id': 0, 'uid': 1, 'goal': 1})
+    }
+    rows = [(doc['uid'], subject) for doc in docs for subject in doc.get('attendance') or []]
+    projected = attendance.reproject([subject for _, subject in rows], [goals.get(uid, 75) for uid, _ in rows])
+    by_uid = {doc['uid']: [] for doc in docs}
+    for (uid, _), subject in zip(rows, projected):
+        by_uid[uid].append(subject)
+    return [uid for uid, subjects in by_uid.items() if _write_section(uid, 'attendance', subjects)[1]]
+
 def update_session_first(uid, session_id, page):
     session_first_db = db['session_first']
     session_first_db.update_one(
             {'uid': uid},
-            {'$set': {'session_id': session_id, 'page': page}},
+            {'$set': {'session_id': session_id, 'page': page, 'updated_at': datetime.utcnow()}},
             upsert=True
         )
     
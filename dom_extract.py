@@ -0,0 +1,153 @@
+import time
+import timings
+
+# A table spec describes rows and the fields to pull out of each row:
+#   rows       CSS selector (or "xpath=..."), resolved against the page or the parent row
+#   scope      for nested specs: "next" (next sibling of the row) or an attribute holding an element id
+#   skip       header rows to drop
+#   min_cells / max_cells   only keep rows whose <td> count is in range
+#   text       "innerText" (default) or "textContent"
+#   fields     name -> field; omitted means "list of cell texts"
+# A field is a <td> index, a CSS selector inside the row, "." for the row itself,
+# {"cell", "selector", "index", "attr"} for finer picks, a nested table spec (has "rows"),
+# or a list of fields where the first non-null wins.
+TABLE_JS = """
+(specs) => {
+    const select = (root, sel) => {
+        if (sel.startsWith('xpath=')) {
+            const found = document.evaluate(sel.slice(6), root, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            return Array.from({length: found.snapshotLength}, (_, i) => found.snapshotItem(i));
+        }
+        return Array.from(root.querySelectorAll(sel));
+    };
+    const read = (el, mode) => el ? (el[mode] || '').trim() : null;
+
+    const pick = (row, cells, field, mode) => {
+        if (Array.isArray(field)) {
+            for (const option of field) {
+                const value = pick(row, cells, option, mode);
+                if (value !== null && value !== undefined) return value;
+            }
+            return null;
+        }
+        if (typeof field === 'number') return read(cells[field], mode);
+        if (field === '.') return read(row, mode);
+        if (typeof field === 'string') return read(row.querySelector(field), mode);
+        if (field.rows) return table(row, field);
+        let el = field.cell !== undefined ? cells[field.cell] : row;
+        if (el && field.selector) {
+            el = field.index !== undefined ? el.querySelectorAll(field.selector)[field.index] : el.querySelector(field.selector);
+        }
+        if (!el) return null;
+        return field.attr ? el.getAttribute(field.attr) : read(el, mode);
+    };
+
+    const table = (parent, spec) => {
+        let root = parent;
+        if (spec.scope === 'next') root = parent.nextElementSibling;
+        else if (spec.scope) root = document.getElementById(parent.getAttribute(spec.scope));
+        if (!root) return [];
+        const mode = spec.text || 'innerText';
+        const out = [];
+        for (const row of select(root, spec.rows).slice(spec.skip || 0)) {
+            const cells = row.querySelectorAll('td');
+            if (cells.length < (spec.min_cells || 0)) continue;
+            if (spec.max_cells !== undefined && cells.length > spec.max_cells) continue;
+            if (!spec.fields) {
+                out.push(Array.from(cells, cell => read(cell, mode)));
+                continue;
+            }
+            const item = {};
+            for (const [name, field] of Object.entries(spec.fields)) item[name] = pick(row, cells, field, mode);
+            out.push(item);
+        }
+        return out;
+    };
+
+    const result = {};
+    for (const [name, spec] of Object.entries(specs)) result[name] = table(document, spec);
+    return result;
+}
+"""
+
+
+async def extract_tables(page, specs: dict) -> dict:
+    started = time.perf_counter()
+    try:
+        return await page.evaluate(TABLE_JS, specs)
+    finally:
+        timings.add('extract_ms', started)
+
+
+async def extract_table(page, spec: dict) -> list:
+    tables = await extract_tables(page, {'table': spec})
+    return tables['table']
+
+
+# Same specs, applied to server-rendered HTML parsed with selectolax (no xpath support).
+def extract_tables_html(tree, specs: dict) -> dict:
+    started = time.perf_counter()
+    try:
+        return {name: _html_table(tree, tree, spec) for name, spec in specs.items()}
+    finally:
+        timings.add('extract_ms', started)
+
+
+def _html_text(node):
+    return node.text(deep=True).strip() if node is not None else None
+
+
+def _html_table(tree, parent, spec):
+    root = parent
+    if spec.get('scope') == 'next':
+        root = parent.next
+        while root is not None and root.tag == '-text':
+            root = root.next
+    elif spec.get('scope'):
+        target = parent.attributes.get(spec['scope'])
+        root = tree.css_first(f'[id="{target}"]') if target else None
+    if root is None:
+        return []
+
+    out = []
+    for row in root.css(spec['rows'])[spec.get('skip', 0):]:
+        cells = row.css('td')
+        if len(cells) < spec.get('min_cells', 0):
+            continue
+        if 'max_cells' in spec and len(cells) > spec['max_cells']:
+            continue
+        if 'fields' not in spec:
+            out.append([_html_text(cell) for cell in cells])
+            continue
+        out.append({name: _html_pick(tree, row, cells, field) for name, field in spec['fields'].items()})
+    return out
+
+
+def _html_pick(tree, row, cells, field):
+    if isinstance(field, list):
+        for option in field:
+            value = _html_pick(tree, row, cells, option)
+            if value is not None:
+                return value
+        return None
+    if isinstance(field, int):
+        return _html_text(cells[field]) if field < len(cells) else None
+    if field == '.':
+        return _html_text(row)
+    if isinstance(field, str):
+        return _html_text(row.css_first(field))
+    if 'rows' in field:
+        return _html_table(tree, row, field)
+
+    node = row
+    if 'cell' in field:
+        node = cells[field['cell']] if field['cell'] < len(cells) else None
+    if node is not None and 'selector' in field:
+        if 'index' in field:
+            matches = node.css(field['selector'])
+            node = matches[field['index']] if field['index'] < len(matches) else None
+        else:
+            node = node.css_first(field['selector'])
+    if node is None:
+        return None
+    return node.attributes.get(field['attr']) if 'attr' in field else _html_text(node)
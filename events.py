@@ -0,0 +1,59 @@
+import asyncio
+import json
+import time
+
+hub = None
+
+
+class EventHub:
+    def __init__(self, max_queued=100):
+        self.max_queued = max_queued
+        self.subscribers = {}
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, uid, event_type, data):
+        message = {"type": event_type, "at": time.time(), **data}
+        self.published += 1
+        for queue in self.subscribers.get(uid, ()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+    async def subscribe(self, uid, heartbeat_s=15):
+        queue = asyncio.Queue(maxsize=self.max_queued)
+        self.subscribers.setdefault(uid, set()).add(queue)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat_s)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield message
+        finally:
+            self.subscribers[uid].discard(queue)
+            if not self.subscribers[uid]:
+                del self.subscribers[uid]
+
+    def stats(self):
+        return {
+            "users": len(self.subscribers),
+            "streams": sum(len(queues) for queues in self.subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+
+def format_sse(message):
+    if message is None:
+        return ": keep-alive\n\n"
+    return f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+
+
+def init_hub():
+    global hub
+    if hub is None:
+        hub = EventHub()
+    return hub
@@ -0,0 +1,167 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+from config import get_config
+
+governor = None
+
+
+class HostLimiter:
+    def __init__(self, rate, burst, max_concurrency, target_latency_ms, max_error_rate, max_level=4):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.target_latency_ms = target_latency_ms
+        self.max_error_rate = max_error_rate
+        self.max_level = max_level
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.condition = asyncio.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.level = 0
+        self.adjusted_at = 0.0
+        self.latency_ms = 0.0
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    # Each throttle level halves both the request rate and the concurrency cap.
+    def current_rate(self):
+        return self.rate / 2 ** self.level
+
+    def current_concurrency(self):
+        return max(1, self.max_concurrency >> self.level)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.current_rate())
+        self.refilled_at = now
+
+    async def acquire(self):
+        self.queued += 1
+        try:
+            async with self.condition:
+                while True:
+                    self._refill()
+                    if self.in_flight < self.current_concurrency() and self.tokens >= 1:
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        return
+                    wait = None if self.in_flight >= self.current_concurrency() else (1 - self.tokens) / self.current_rate()
+                    try:
+                        await asyncio.wait_for(self.condition.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self.queued -= 1
+
+    async def release(self, latency_ms, failed):
+        async with self.condition:
+            self.in_flight -= 1
+            self.calls += 1
+            self.errors += failed
+            self.latency_ms = latency_ms if self.calls == 1 else 0.8 * self.latency_ms + 0.2 * latency_ms
+            self.error_rate = 0.8 * self.error_rate + 0.2 * (1.0 if failed else 0.0)
+            self._adapt()
+            self.condition.notify_all()
+
+    def _adapt(self):
+        # Back off quickly when upstream struggles, recover one step at a time once it is healthy.
+        now = time.monotonic()
+        if now - self.adjusted_at < 5:
+            return
+        struggling = self.latency_ms > self.target_latency_ms or self.error_rate > self.max_error_rate
+        healthy = self.latency_ms < self.target_latency_ms / 2 and self.error_rate < self.max_error_rate / 2
+        if struggling and self.level < self.max_level:
+            self.level += 1
+            self.adjusted_at = now
+        elif healthy and self.level > 0:
+            self.level -= 1
+            self.adjusted_at = now
+
+    def stats(self):
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "throttle_level": self.level,
+            "rate_per_s": round(self.current_rate(), 2),
+            "concurrency": self.current_concurrency(),
+            "latency_ms": round(self.latency_ms, 1),
+            "error_rate": round(self.error_rate, 3),
+            "calls": self.calls,
+            "errors": self.errors,
+        }
+
+
+class Call:
+    def __init__(self):
+        self.failed = False
+
+    def fail(self):
+        self.failed = True
+
+    def check(self, response):
+        # Playwright responses expose .status, httpx responses .status_code.
+        status = getattr(response, 'status', None) or getattr(response, 'status_code', None)
+        if status is not None and (status >= 500 or status == 429):
+            self.failed = True
+        return response
+
+
+class Governor:
+    def __init__(self, limits):
+        self.limits = limits
+        self.hosts = {}
+
+    def host(self, name):
+        limiter = self.hosts.get(name)
+        if limiter is None:
+            limiter = self.hosts[name] = HostLimiter(**self.limits.get(name, self.limits['*']))
+        return limiter
+
+    @asynccontextmanager
+    async def limit(self, url):
+        limiter = self.host(urlsplit(url).hostname or url)
+        await limiter.acquire()
+        call = Call()
+        started = time.perf_counter()
+        try:
+            yield call
+        except Exception:
+            call.fail()
+            raise
+        finally:
+            await limiter.release((time.perf_counter() - started) * 1000, call.failed)
+
+    def stats(self):
+        return {name: limiter.stats() for name, limiter in self.hosts.items()}
+
+
+def init_governor():
+    global governor
+    if governor is None:
+        config = get_config()
+        governor = Governor({
+            'students.cuchd.in': dict(
+                rate=config['CUIMS_RATE_PER_S'],
+                burst=config['CUIMS_BURST'],
+                max_concurrency=config['CUIMS_MAX_CONCURRENCY'],
+                target_latency_ms=config['CUIMS_TARGET_LATENCY_MS'],
+                max_error_rate=0.2,
+            ),
+            'api.ocr.space': dict(
+                rate=config['OCR_RATE_PER_S'],
+                burst=config['OCR_RATE_PER_S'],
+                max_concurrency=config['OCR_MAX_CONCURRENCY'],
+                target_latency_ms=config['OCR_TIMEOUT'] * 500,
+                max_error_rate=0.3,
+            ),
+            '*': dict(rate=10, burst=10, max_concurrency=10, target_latency_ms=5000, max_error_rate=0.3),
+        })
+    return governor
+
+
+def limit(url):
+    return init_governor().limit(url)
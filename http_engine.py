@@ -0,0 +1,95 @@
+import time
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+from config import get_config
+import dom_extract as dom
+import governor
+import timings
+
+client = None
+
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
+)
+
+
+class SessionExpired(Exception):
+    pass
+
+
+def init_client():
+    global client
+    if client is None:
+        config = get_config()
+        client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=httpx.Timeout(config['HTTP_TIMEOUT']),
+            limits=httpx.Limits(
+                max_connections=config['HTTP_MAX_CONNECTIONS'],
+                max_keepalive_connections=config['HTTP_MAX_CONNECTIONS'],
+            ),
+            follow_redirects=False,
+        )
+    return client
+
+
+async def close_client():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
+
+
+def cookie_header(storage_state, host="students.cuchd.in"):
+    cookies = []
+    for cookie in (storage_state or {}).get('cookies', []):
+        domain = cookie.get('domain', '').lstrip('.')
+        if host == domain or host.endswith('.' + domain):
+            cookies.append(f"{cookie['name']}={cookie['value']}")
+    return "; ".join(cookies)
+
+
+def form_state(tree):
+    # Hidden ASP.NET fields (__VIEWSTATE, __EVENTVALIDATION, ...) that must be echoed back on postback.
+    state = {}
+    for node in tree.css("form input[type='hidden']"):
+        name = node.attributes.get('name')
+        if name:
+            state[name] = node.attributes.get('value') or ''
+    return state
+
+
+class HttpScraper:
+    def __init__(self, storage_state):
+        self.headers = {"Cookie": cookie_header(storage_state)}
+
+    async def _send(self, method, url, **kwargs):
+        started = time.perf_counter()
+        try:
+            async with governor.limit(url) as call:
+                response = call.check(await init_client().request(method, url, headers=self.headers, **kwargs))
+        finally:
+            timings.add('fetch_ms', started)
+        location = response.headers.get('location', '')
+        if response.is_redirect and 'login' in location.lower():
+            raise SessionExpired(f"Session expired while fetching {url}")
+        response.raise_for_status()
+        return LexborHTMLParser(response.text)
+
+    async def fetch(self, url):
+        return await self._send("GET", url)
+
+    async def postback(self, url, tree, event_target, event_argument=""):
+        data = form_state(tree)
+        data['__EVENTTARGET'] = event_target
+        data['__EVENTARGUMENT'] = event_argument
+        return await self._send("POST", url, data=data)
+
+    async def extract(self, url, specs, postback=None):
+        tree = await self.fetch(url)
+        tables = dom.extract_tables_html(tree, specs)
+        if postback and not any(tables.values()):
+            tree = await self.postback(url, tree, *postback)
+            tables = dom.extract_tables_html(tree, specs)
+        return tables
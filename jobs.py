@@ -0,0 +1,191 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime
+import async_database as adb
+from config import get_config
+from cuims_scrapper import REFRESH_MODES
+import events
+import leases
+
+queue = None
+
+
+class QueueFull(Exception):
+    pass
+
+
+def refreshed_within(last_updated, seconds):
+    # Held under the refresh lease, so "Refreshing Data" here is a refresh that died, not a fresh one.
+    try:
+        return (datetime.now() - datetime.fromisoformat(last_updated)).total_seconds() < seconds
+    except (TypeError, ValueError):
+        return False
+
+
+class Job:
+    def __init__(self, uid, mode, password, skip_if_fresh_s=None):
+        self.id = uuid.uuid4().hex
+        self.uid = uid
+        self.mode = mode
+        self.password = password
+        # Background jobs: never wait behind another refresh, and skip users refreshed this recently.
+        self.skip_if_fresh_s = skip_if_fresh_s
+        self.status = "queued"
+        self.phase = "queued"
+        self.sections = {name: "pending" for name in REFRESH_MODES.get(mode, [])}
+        self.error = None
+        self.reason = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = asyncio.Event()
+
+    def progress(self, phase, section=None):
+        self.phase = phase
+        if section is not None:
+            self.sections[section] = "done"
+
+    def publish(self):
+        events.init_hub().publish(self.uid, "job", {"job_id": self.id, "status": self.status, "error": self.error})
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "mode": self.mode,
+            "status": self.status,
+            "phase": self.phase,
+            "sections": self.sections,
+            "error": self.error,
+            "reason": self.reason,
+            "result": self.result,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    def __init__(self, runner, workers=2, max_queued=100, keep_finished_s=3600):
+        self.runner = runner
+        self.workers = workers
+        self.keep_finished_s = keep_finished_s
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.jobs = {}
+        self.active = {}
+        self.tasks = []
+
+    def start(self):
+        for _ in range(self.workers):
+            self.tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def submit(self, uid, mode, password, skip_if_fresh_s=None):
+        # A repeat click for the same mode gets the job already in flight. A different mode is
+        # queued as its own job; the refresh lease then runs it once the first one finishes.
+        active = self.active.get((uid, mode))
+        if active is not None:
+            return active
+        self._prune()
+        job = Job(uid, mode, password, skip_if_fresh_s)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull("Too many refreshes queued, try again shortly")
+        self.jobs[job.id] = job
+        self.active[(uid, mode)] = job
+        return job
+
+    def is_active(self, uid):
+        return any(active_uid == uid for active_uid, _ in self.active)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def latest_for(self, uid):
+        jobs = [job for job in self.jobs.values() if job.uid == uid]
+        return max(jobs, key=lambda job: job.created_at) if jobs else None
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_finished_s
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at and job.finished_at < cutoff:
+                del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            job.publish()
+            try:
+                result = await self._run(job)
+                if result["status"] == "success":
+                    job.status = "done"
+                    job.result = {key: value for key, value in result.items() if key != "status"}
+                else:
+                    job.status = "failed"
+                    job.error = result.get("message")
+                    job.reason = result.get("reason")
+            except Exception as e:
+                print(f"Refresh job {job.id} failed: {e}")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.password = None
+                job.finished_at = time.time()
+                self.active.pop((job.uid, job.mode), None)
+                self.queue.task_done()
+                job.done.set()
+                job.publish()
+
+    async def _run(self, job):
+        # The refresh lease keeps two workers, or two tasks here, from scraping the same uid at once.
+        # A user's job that finds it held waits its turn and then runs its own mode.
+        async def run():
+            job.phase = "running"
+            return await self.runner(job.uid, job.password, job.mode, progress=job.progress)
+
+        manager = leases.init_manager()
+        if job.skip_if_fresh_s is not None:
+            # Every worker's scheduler sees the same stale users; whoever gets the lease first does the
+            # refresh and the rest drop out instead of logging in again right after it.
+            try:
+                async with manager.hold('refresh', job.uid):
+                    state = await adb.get_refresh_state(job.uid)
+                    if refreshed_within((state or {}).get('last_updated'), job.skip_if_fresh_s):
+                        return {"status": "success", "message": "Already refreshed", "skipped": True}
+                    return await run()
+            except leases.LeaseHeld:
+                return {"status": "success", "message": "Refresh already running elsewhere", "skipped": True}
+
+        job.phase = "waiting for lease"
+        try:
+            return await manager.exclusive('refresh', job.uid, run)
+        except leases.LeaseHeld:
+            return {"status": "error", "message": "Another refresh for this user is still running"}
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "running": sum(1 for job in self.jobs.values() if job.status == "running"),
+            "workers": self.workers,
+        }
+
+
+def init_queue(runner):
+    global queue
+    if queue is None:
+        config = get_config()
+        queue = JobQueue(
+            runner,
+            workers=config['REFRESH_WORKERS'],
+            max_queued=config['REFRESH_MAX_QUEUED'],
+        )
+    return queue
@@ -0,0 +1,119 @@
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+import async_database as adb
+import database as db
+from config import get_config
+
+manager = None
+
+
+class LeaseHeld(Exception):
+    def __init__(self, kind, uid, lease):
+        self.lease = lease or {}
+        super().__init__(f"{kind} for {uid} is held by {self.lease.get('owner', 'another worker')}")
+
+
+class LeaseManager:
+    def __init__(self, ttl_s=60, wait_s=300, worker_url=''):
+        self.ttl_s = ttl_s
+        self.wait_s = wait_s
+        self.worker_url = worker_url
+        self.heartbeats = {}
+        self.acquired = 0
+        self.contended = 0
+        self.lost = 0
+
+    async def acquire(self, kind, uid):
+        # Returns this holder's token, or None while anyone else holds it, including another task here.
+        token = uuid.uuid4().hex
+        if not await adb.acquire_lease(kind, uid, token, self.ttl_s, self.worker_url):
+            self.contended += 1
+            return None
+        self.acquired += 1
+        # Taking a lease starts its heartbeat; a crashed worker stops renewing and the lease lapses.
+        self.heartbeats[token] = (kind, uid, asyncio.create_task(self._heartbeat(kind, uid, token)))
+        return token
+
+    async def release(self, kind, uid, token):
+        held = self.heartbeats.pop(token, None)
+        if held is not None:
+            task = held[2]
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await adb.release_lease(kind, uid, token)
+
+    async def owner(self, kind, uid):
+        return await adb.get_lease(kind, uid)
+
+    def is_mine(self, lease):
+        return lease is not None and lease.get('owner') == db.WORKER_ID
+
+    @asynccontextmanager
+    async def hold(self, kind, uid):
+        token = await self.acquire(kind, uid)
+        if token is None:
+            raise LeaseHeld(kind, uid, await self.owner(kind, uid))
+        try:
+            yield token
+        finally:
+            await self.release(kind, uid, token)
+
+    async def exclusive(self, kind, uid, fn):
+        # Waits for the current holder, then runs fn under our own lease; LeaseHeld after wait_s.
+        deadline = time.monotonic() + self.wait_s
+        while True:
+            try:
+                async with self.hold(kind, uid):
+                    return await fn()
+            except LeaseHeld:
+                if not await self.wait_released(kind, uid, deadline - time.monotonic()):
+                    raise
+
+    async def wait_released(self, kind, uid, timeout_s, poll_s=2):
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            if await self.owner(kind, uid) is None:
+                return True
+            await asyncio.sleep(poll_s)
+        return False
+
+    async def _heartbeat(self, kind, uid, token):
+        while True:
+            await asyncio.sleep(self.ttl_s / 3)
+            try:
+                renewed = await adb.renew_lease(kind, uid, token, self.ttl_s)
+            except Exception as e:
+                print(f"Lease heartbeat for {kind}:{uid} failed: {e}")
+                continue
+            if not renewed:
+                print(f"Lost {kind} lease for {uid}")
+                self.lost += 1
+                self.heartbeats.pop(token, None)
+                return
+
+    async def stop(self):
+        for token, (kind, uid, _) in list(self.heartbeats.items()):
+            await self.release(kind, uid, token)
+
+    def stats(self):
+        return {
+            "worker": db.WORKER_ID,
+            "held": len(self.heartbeats),
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "lost": self.lost,
+        }
+
+
+def init_manager():
+    global manager
+    if manager is None:
+        config = get_config()
+        manager = LeaseManager(
+            ttl_s=config['LEASE_TTL_S'],
+            wait_s=config['LEASE_WAIT_S'],
+            worker_url=config['WORKER_URL'].rstrip('/'),
+        )
+    return manager
@@ -1,6 +1,6 @@
 import asyncio
-from fastapi import FastAPI, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, Response, HTTPException, Form
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime, timedelta
@@ -8,16 +8,73 @@ import jwt
 from typing import Optional
 from config import get_config
 import database as db
+from cache import TTLCache, MISSING
+import time
+import hashlib
+import os
+import async_database as adb
 from dotenv import load_dotenv
 from cryptography.fernet import Fernet
-from cuims_scrapper import refresh_user_data
+from cuims_scrapper import refresh_user_data, CUIMSScraper, REFRESH_MODES
 from pydantic import BaseModel
 import base64
-from playwright.async_api import async_playwright
+import httpx
+from contextlib import asynccontextmanager
+import browser_pool
+import captcha_solver
+import ocr_client
+import session_manager
+import governor
+import onboarding
+import leases
+import scheduler
+import render_cache
+import http_engine
+import request_filter
+import jobs
+import events
 
 load_dotenv()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Initializing database...")
+    db.init_db()
+    await adb.run(db.ensure_indexes)
+    print("Database initialized successfully.")
+    print("Starting browser pool...")
+    pool = browser_pool.init_pool()
+    await pool.start()
+    print("Browser pool started successfully.")
+    http_engine.init_client()
+    captcha_solver.init_solver()
+    ocr_client.init_client()
+    session_manager.init_manager().start()
+    onboarding.init_manager().start()
+    events.init_hub()
+    jobs.init_queue(refresh_user_data).start()
+    scheduler.init_scheduler(stored_password).start()
+    adb.init_executor()
+    invalidation_listener = None
+    if config['CACHE_INVALIDATION_CHANNEL'] == 'mongo':
+        invalidation_listener = asyncio.create_task(adb.listen_for_invalidations())
+    yield
+    if invalidation_listener is not None:
+        invalidation_listener.cancel()
+    await scheduler.init_scheduler(stored_password).stop()
+    await jobs.queue.stop()
+    await session_manager.init_manager().stop()
+    await onboarding.init_manager().stop()
+    await leases.init_manager().stop()
+    adb.close_executor()
+    db.close_db()
+    await http_engine.close_client()
+    captcha_solver.close_solver()
+    await ocr_client.close_client()
+    await browser_pool.close_pool()
+
 print("Starting FastAPI application...")
-app = FastAPI(title="Web Automation Dashboard")
+app = FastAPI(title="Web Automation Dashboard", lifespan=lifespan)
 print("FastAPI application initialized.")
 
 print("Mounting static files...")
@@ -25,9 +82,6 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 print("Static files mounted successfully.")
 
 templates = Jinja2Templates(directory="templates")
-print("Initializing database...")
-db.init_db()
-print("Database initialized successfully.")
 
 print("Loading configuration...")
 config = get_config()
@@ -38,20 +92,46 @@ FERNET_KEY = config["FERNET_KEY"]
 fernet = Fernet(FERNET_KEY.encode())
 print("Encryption key set up successfully.")
 
+SECRET_KEY = str(config['SECRET_KEY'])
+
+# Verified token claims, so repeat requests skip the HMAC check.
+token_cache = TTLCache(max_entries=config['AUTH_CACHE_MAX_ENTRIES'], ttl_s=config['AUTH_CACHE_TTL_S'])
+
 def verify_token(token: str):
-    print("Verifying token...")
-    try:
-        config = get_config()
-        payload = jwt.decode(token, str(config['SECRET_KEY']), algorithms=["HS256"])
-        username: str = payload.get("sub")
-        if username is None:
-            print("Token verification failed: username is None.")
+    claims = token_cache.get(token)
+    if claims is MISSING:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        except jwt.PyJWTError:
+            return None
+        if payload.get("sub") is None:
             return None
-        print("Token verified successfully.")
-        return username
-    except jwt.PyJWTError:
-        print("Token verification failed: PyJWTError.")
+        claims = {
+            "uid": payload["sub"],
+            "goal": payload.get("goal", 75),
+            "ver": payload.get("ver", 0),
+            "exp": payload["exp"]
+        }
+        token_cache.set(token, claims)
+    if claims["exp"] <= time.time():
         return None
+    return claims
+
+async def authenticate(request: Request):
+    token = request.cookies.get("access_token")
+    if not token:
+        return None
+    claims = verify_token(token)
+    if not claims:
+        return None
+    # Revocation: the token's version must match the user's current one (cached in-process).
+    version = db.peek(claims["uid"], 'token_version')
+    if version is MISSING:
+        version = await adb.get_token_version(claims["uid"])
+    if version is None or version != claims["ver"]:
+        return None
+    session_manager.init_manager().seen(claims["uid"])
+    return claims
 
 def encrypt_password(password: str) -> str:
     print("Encrypting password...")
@@ -63,6 +143,10 @@ def decrypt_password(encrypted_password: str) -> str:
     return fernet.decrypt(encrypted_password.encode()).decode()
     print("Password decrypted successfully.")
 
+async def stored_password(uid: str):
+    user_doc = await adb.get_user_by_uid(uid)
+    return decrypt_password(user_doc['hashed_password']) if user_doc else None
+
 def verify_password(plain_password: str, encrypted_password: str) -> bool:
     print("Verifying password...")
     try:
@@ -74,15 +158,74 @@ def verify_password(plain_password: str, encrypted_password: str) -> bool:
         print("Password verification failed: Exception occurred.")
         return False 
 
-def get_current_user(request: Request):
-    token = request.cookies.get("access_token")
-    if not token:
-        return None
-    uid = verify_token(token)
-    if not uid:
+async def get_current_user(request: Request):
+    return await authenticate(request)
+
+async def load_page(request: Request, fields: list):
+    claims = await authenticate(request)
+    if not claims:
         return None
-    user = db.get_user_by_uid(uid)
-    return user
+    return await adb.get_page_data(claims["uid"], fields)
+
+def templates_version(directory="templates") -> str:
+    # Any template edit changes every ETag, so a deploy never serves stale markup.
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), "rb") as f:
+            digest.update(name.encode() + f.read())
+    return digest.hexdigest()[:12]
+
+TEMPLATES_VERSION = templates_version()
+conditional_stats = {"checked": 0, "not_modified": 0}
+
+async def page_etag(request: Request, fields: list):
+    # Built from small cached fields only, so a 304 never loads or renders the page data.
+    claims = await authenticate(request)
+    if not claims:
+        return None, None
+    keys = ["last_updated"] + [f"{field}_version" for field in fields if field in db.SECTIONS]
+    meta = await adb.get_page_data(claims["uid"], keys)
+    if meta is None:
+        return None, None
+    parts = [claims["uid"], TEMPLATES_VERSION, str(meta.get("goal")), str(meta.get("last_updated")),
+             datetime.now().date().isoformat(), request.url.path, str(request.url.query)]
+    parts += [f"{key}={meta.get(key)}" for key in keys[1:]]
+    return claims["uid"], 'W/"' + hashlib.sha256("|".join(parts).encode()).hexdigest()[:20] + '"'
+
+async def revalidate(request: Request, fields: list):
+    # Returns (etag, None) when the page must be rendered, else a redirect, a 304
+    # or an already-rendered body to send as-is.
+    uid, etag = await page_etag(request, fields)
+    if etag is None:
+        return None, RedirectResponse(url="/login", status_code=302)
+    conditional_stats["checked"] += 1
+    tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in tags or "*" in tags:
+        conditional_stats["not_modified"] += 1
+        return etag, with_etag(Response(status_code=304), etag)
+    body = render_cache.init_cache().get(uid, request.url.path, etag)
+    if body is not None:
+        response = with_etag(HTMLResponse(body), etag)
+        response.headers["Server-Timing"] = "render;desc=cached;dur=0"
+        return etag, response
+    return etag, None
+
+def render_page(request: Request, uid: str, etag: str, template: str, context: dict):
+    started = time.perf_counter()
+    response = templates.TemplateResponse(template, {"request": request, **context})
+    render_ms = (time.perf_counter() - started) * 1000
+    render_cache.init_cache().set(uid, request.url.path, etag, response.body, render_ms)
+    response.headers["Server-Timing"] = f"render;dur={render_ms:.1f}"
+    return with_etag(response, etag)
+
+def with_etag(response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["Vary"] = "Cookie"
+    return response
+
+def token_claims(user: dict) -> dict:
+    return {"sub": user["uid"], "goal": user.get("goal", 75), "ver": user.get("token_version", 0)}
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     print("Creating access token...")
@@ -92,15 +235,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(days=30)
     to_encode.update({"exp": expire})
-    config = get_config()
-    encoded_jwt = jwt.encode(to_encode, str(config['SECRET_KEY']), algorithm="HS256")
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm="HS256")
     print("Access token created successfully.")
     return encoded_jwt
 
+@app.middleware("http")
+async def count_db_round_trips(request: Request, call_next):
+    counter = {'count': 0}
+    db.round_trips.set(counter)
+    response = await call_next(request)
+    response.headers["X-DB-Round-Trips"] = str(counter['count'])
+    return response
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     print("Handling home route...")
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         print("User not authenticated. Redirecting to login page.")
         return RedirectResponse(url="/login", status_code=302)
@@ -115,10 +265,10 @@ async def login_page(request: Request):
 @app.post("/login")
 async def login(request: Request, uid: str = Form(...), password: str = Form(...)):
     print("Handling login request...")
-    user = db.get_user_by_uid(uid)
+    user = await adb.get_user_by_uid(uid)
     if not user:
         print("User not found. Redirecting to welcome page.")
-        db.insert_new_user(uid)
+        await adb.insert_new_user(uid)
         return templates.TemplateResponse("welcome.html", {
             "request": request,
             "uid": uid,
@@ -130,7 +280,7 @@ async def login(request: Request, uid: str = Form(...), password: str = Form(...
             "request": request,
             "error": "Invalid credentials"
         })
-    access_token = create_access_token(data={"sub": user["uid"]})
+    access_token = create_access_token(data=token_claims(user))
     response = RedirectResponse(url="/", status_code=302)
     response.set_cookie(
         key="access_token",
@@ -146,8 +296,9 @@ async def login(request: Request, uid: str = Form(...), password: str = Form(...
 async def register(request: Request, uid: str = Form(...), password: str = Form(...)):
     print("Handling register request...")
     hashed_password = encrypt_password(password)
-    user_doc = db.create_user_document(uid, hashed_password)
-    access_token = create_access_token(data={"sub": uid})
+    await adb.create_user_document(uid, hashed_password)
+    user_doc = await adb.get_user_by_uid(uid)
+    access_token = create_access_token(data=token_claims(user_doc))
     response = RedirectResponse(url="/", status_code=302)
     response.set_cookie(
         key="access_token",
@@ -162,23 +313,26 @@ async def register(request: Request, uid: str = Form(...), password: str = Form(
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(request: Request, success: Optional[bool] = False):
     print("Handling dashboard route...")
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["profile", "attendance", "timetable", "last_updated", "courses"])
+    if early:
+        return early
+    user = await load_page(request, ["profile", "attendance", "timetable", "last_updated", "courses"])
     if not user:
         print("User not authenticated. Redirecting to login page.")
         return RedirectResponse(url="/login", status_code=302)
-    name = db.get_profile(user['uid'])['Name']
-    branch = db.get_profile(user['uid'])['Program Code']
-    attendance = db.get_attendance(user['uid'])
-    timetable = db.get_timetable(user['uid'])
+    profile = user['profile']
+    name = profile['Name']
+    branch = profile['Program Code']
+    attendance = user['attendance']
+    timetable = user['timetable']
     today_weekday = datetime.today().weekday()
     timetable_today = timetable[today_weekday]
-    last_updated = db.get_last_updated(user['uid'])
-    courses = db.get_courses(user['uid'])
+    last_updated = user['last_updated']
+    courses = user['courses']
     course_map = {course["course_code"]: course["course_name"] for course in courses}
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
     print("Dashboard data fetched successfully.")
-    return templates.TemplateResponse("dashboard.html", {
-        "request": request,
+    return render_page(request, user["uid"], etag, "dashboard.html", {
         "name": name,
         "user": user,
         "branch":branch,
@@ -192,15 +346,17 @@ async def dashboard(request: Request, success: Optional[bool] = False):
 
 @app.get("/predictor", response_class=HTMLResponse)
 async def predictor(request : Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated", "attendance", "timetable"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated", "attendance", "timetable"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
-    attendance = db.get_attendance(user['uid'])
-    timetable = db.get_timetable(user['uid'])
-    return templates.TemplateResponse("predictor.html", {
-        "request": request,
+    attendance = user['attendance']
+    timetable = user['timetable']
+    return render_page(request, user["uid"], etag, "predictor.html", {
         "timetable": timetable,
         "attendance": attendance,
         "active_page" : 'predictor',
@@ -209,12 +365,15 @@ async def predictor(request : Request):
 
 @app.get("/timetable", response_class=HTMLResponse)
 async def timetable(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["timetable", "courses", "last_updated"])
+    if early:
+        return early
+    user = await load_page(request, ["timetable", "courses", "last_updated"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
-    timetable = db.get_timetable(user['uid'])
-    courses = db.get_courses(user['uid'])
-    last_updated = db.get_last_updated(user['uid'])
+    timetable = user['timetable']
+    courses = user['courses']
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated)if last_updated != "Refreshing Data" else last_updated
     course_map = {course["course_code"]: course["course_name"] for course in courses}
     today_date = datetime.now().strftime("%A, %B %d, %Y")
@@ -229,8 +388,7 @@ async def timetable(request: Request):
         5 : "Saturday",
         6 : "Sunday"
     }
-    return templates.TemplateResponse("timetable.html", {
-        "request": request,
+    return render_page(request, user["uid"], etag, "timetable.html", {
         "timetable": timetable,
         "today_date":today_date,
         "timetable_today" : timetable_today,
@@ -243,19 +401,25 @@ async def timetable(request: Request):
     
 @app.get("/more")
 async def more(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
-    return templates.TemplateResponse("more.html",{
-        "request": request,
+    return render_page(request, user["uid"], etag, "more.html", {
         "active_page" : "more",
         "last_updated" : last_updated
     })
 
 @app.get("/logout")
-async def logout():
+async def logout(request: Request, everywhere: Optional[bool] = False):
+    if everywhere:
+        user = await get_current_user(request)
+        if user:
+            await adb.revoke_tokens(user["uid"])
     response = RedirectResponse(url="/login", status_code=302)
     response.delete_cookie("access_token")
     return response
@@ -276,30 +440,88 @@ async def refresh_data(request: Request, data_to_be_fetched: Optional[str] = For
 
     if not data_to_be_fetched:
         raise HTTPException(status_code=400, detail="data_to_be_fetched is required")
+    if data_to_be_fetched not in REFRESH_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown data_to_be_fetched: {data_to_be_fetched}")
 
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     print('refresh-data', data_to_be_fetched)
-    
-    result = await refresh_user_data(user['uid'], decrypt_password(user['hashed_password']), data_to_be_fetched)
 
-    if result["status"] == "success":
-        if data_to_be_fetched == 'initial':
-            return RedirectResponse(url="/dashboard?success=true", status_code=302)
-        else:
-            return {"status": "success"}
-    else:
-        raise HTTPException(status_code=500, detail=result["message"])
+    # The only route that needs the full user record.
+    user_doc = await adb.get_user_by_uid(user['uid'])
+    try:
+        job = jobs.queue.submit(user['uid'], data_to_be_fetched, decrypt_password(user_doc['hashed_password']))
+    except jobs.QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status})
+
+@app.get("/jobs")
+async def latest_job(request: Request):
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    job = jobs.queue.latest_for(user['uid'])
+    if not job:
+        raise HTTPException(status_code=404, detail="No refresh jobs")
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    job = jobs.queue.get(job_id)
+    if not job or job.uid != user['uid']:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "browser_pool": browser_pool.init_pool().stats(),
+        "onboarding": onboarding.init_manager().stats(),
+        "request_filter": request_filter.totals,
+        "outbound": governor.init_governor().stats(),
+        "refresh_jobs": jobs.queue.stats(),
+        "refresh_scheduler": scheduler.init_scheduler(stored_password).stats(),
+        "events": events.hub.stats(),
+        "cache": db.cache.stats(),
+        "render_cache": render_cache.init_cache().stats(),
+        "conditional_get": {**conditional_stats, "hit_rate": round(conditional_stats["not_modified"] / conditional_stats["checked"], 3) if conditional_stats["checked"] else 0.0},
+        "captcha": captcha_solver.init_solver().stats(),
+        "ocr": ocr_client.init_client().stats(),
+        "sessions": session_manager.init_manager().stats(),
+        "leases": leases.init_manager().stats()
+    }
+
+@app.get("/events")
+async def refresh_events(request: Request):
+    user = await get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+
+    async def stream():
+        async for message in events.hub.subscribe(user['uid']):
+            if await request.is_disconnected():
+                break
+            yield events.format_sse(message)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
 
 @app.get("/get-status")
 async def get_status(request: Request):
-    user = get_current_user(request)
+    user = await load_page(request, ["last_updated"] + [f"{name}_version" for name in db.SECTIONS])
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    status = db.get_last_updated(user['uid'])
-    return {"status": status}
+    status = user['last_updated']
+    versions = {name: user.get(f"{name}_version") for name in db.SECTIONS}
+    return {"status": status, "versions": versions}
 
 
 class FirstTimeUserRequest(BaseModel):
@@ -308,89 +530,113 @@ class FirstTimeUserRequest(BaseModel):
     step: str = "first"
     captcha: str = None
 
-# app.py (FastAPI)
-sessions = {}  # store {uid: {page, browser, context}}
+async def forward_onboarding(request: Request, data: FirstTimeUserRequest, lease):
+    # The browser for this sign-up lives on another worker, so the step is proxied there.
+    owner_url = lease.get('owner_url')
+    if not owner_url or request.headers.get("X-Onboarding-Forwarded"):
+        raise HTTPException(status_code=409, detail="Sign-up is in progress on another worker")
+    payload = data.dict()
+    if data.step == "first":
+        # Only the later steps use the password; keep it off the internal hop when it isn't needed.
+        payload["password"] = ""
+    try:
+        # Shared pooled client, bounded so a hung owner cannot hold this request open forever.
+        response = await http_engine.init_client().post(
+            f"{owner_url}/first-time-user",
+            json=payload,
+            headers={"X-Onboarding-Forwarded": db.WORKER_ID},
+            timeout=config['ONBOARDING_FORWARD_TIMEOUT_S'],
+        )
+    except httpx.HTTPError as e:
+        print(f"Forwarding onboarding for {data.uid} to {owner_url} failed: {e}")
+        raise HTTPException(status_code=502, detail="Sign-up worker unreachable")
+    return Response(content=response.content, status_code=response.status_code, media_type="application/json")
 
 @app.post("/first-time-user")
-async def first_time_user(data: FirstTimeUserRequest):
+async def first_time_user(data: FirstTimeUserRequest, request: Request):
     uid = data.uid
     password = data.password
+    sessions = onboarding.init_manager()
+
+    if not sessions.get(uid):
+        owner = await leases.init_manager().owner('onboarding', uid)
+        if owner is not None and not leases.init_manager().is_mine(owner):
+            return await forward_onboarding(request, data, owner)
 
     if data.step == "first":
-        p = await async_playwright().start()
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context()
-        page = await context.new_page()
-
-        await page.goto("https://students.cuchd.in/Login.aspx")
-        await page.fill("#txtUserId", uid)
-        await page.click("#btnNext")
-        await page.wait_for_selector("#imgCaptcha")
-
-        captcha_element = await page.query_selector("#imgCaptcha")
-        captcha_bytes = await captcha_element.screenshot()
-        image_b64 = base64.b64encode(captcha_bytes).decode()
+        try:
+            lease = await sessions.open(uid)
+        except onboarding.CapacityFull as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        except leases.LeaseHeld as e:
+            return await forward_onboarding(request, data, e.lease)
 
-        sessions[uid] = {
-            "page": page,
-            "browser": browser,
-            "context": context,
-        }
+        page = lease.page
+        try:
+            login_url = "https://students.cuchd.in/Login.aspx"
+            async with governor.limit(login_url):
+                await page.goto(login_url)
+            await page.fill("#txtUserId", uid)
+            async with governor.limit(login_url):
+                await page.click("#btnNext")
+            await page.wait_for_selector("#imgCaptcha")
+
+            captcha_element = await page.query_selector("#imgCaptcha")
+            captcha_bytes = await captcha_element.screenshot()
+        except Exception as e:
+            print(f"Onboarding captcha step failed for {uid}: {e}")
+            await sessions.close(uid)
+            return JSONResponse(content={"status": "error", "msg": "Could not reach CUIMS"})
+        image_b64 = base64.b64encode(captcha_bytes).decode()
 
         return JSONResponse(content={"status": "captcha", "captcha_image": image_b64})
 
     elif data.step == "second":
-        captcha = data.captcha
-        session = sessions.get(uid)
-
-        if not session:
+        lease = sessions.get(uid)
+        if not lease:
             return JSONResponse(content={"status": "error", "msg": "Session expired"})
 
-        page = session["page"]
+        outcome = await CUIMSScraper()._login_second(lease.page, password, data.captcha)
 
-        await page.fill("#txtLoginPassword", password)
-        await page.fill("#txtcaptcha", captcha)
-        await page.click("#btnLogin")
-        await page.wait_for_timeout(2000)
-
-        if page.url == 'https://students.cuchd.in/StudentHome.aspx':
-            # Clean up!
-            # await session["browser"].close()
-            # sessions.pop(uid, None)
+        if outcome == "ok":
+            # Kept open for step 'third', which saves the logged-in session.
             return JSONResponse(content={"status": "success"})
         else:
-            await session["browser"].close()
-            sessions.pop(uid, None)
+            await sessions.close(uid)
             return JSONResponse(content={"status": "error", "msg": "Invalid login"})
         
     elif data.step == 'third':
-        session = sessions.get(uid)
-        page = session["page"]
-        context = session['context']
-        
-        storage_state = await context.storage_state()
-        db.save_session(uid, storage_state)
-        
-        await session["browser"].close()
-        sessions.pop(uid, None)
+        lease = sessions.get(uid)
+        if not lease:
+            return JSONResponse(content={"status": "error", "msg": "Session expired"})
+
+        storage_state = await lease.context.storage_state()
+        await adb.save_session(uid, storage_state)
+        await sessions.close(uid, completed=True)
         
-        add_new_data = await refresh_user_data(uid,password,'all')
+        try:
+            add_new_data = await leases.init_manager().exclusive('refresh', uid, lambda: refresh_user_data(uid,password,'all'))
+        except leases.LeaseHeld:
+            add_new_data = {"status": "error", "message": "A refresh is already running for this user"}
         
         if add_new_data['status'] == 'success':
             return JSONResponse(content={"status": "success"})
-        
+        return JSONResponse(content={"status": "error", "msg": add_new_data.get("message", "Refresh failed")})
 
 
 @app.get("/more/marks")
 async def marks(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated", "marks"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated", "marks"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    marks_data = db.get_marks(user["uid"])
+    marks_data = user['marks']
     labels, data = [], []
 
     for subject, details in marks_data.items():
@@ -409,8 +655,7 @@ async def marks(request: Request):
         avg_percentage = round((obtained / max_marks) * 100) if max_marks else 0
         data.append(avg_percentage)
 
-    return templates.TemplateResponse("marks.html", {
-        "request": request,
+    return render_page(request, user["uid"], etag, "marks.html", {
         "marks": marks_data,
         "radar_labels": labels,
         "radar_data": data,
@@ -420,16 +665,18 @@ async def marks(request: Request):
 
 @app.get("/more/result")
 async def result(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated", "result"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated", "result"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    result_data = db.get_result(user["uid"])
-    return templates.TemplateResponse("result.html", {
-        "request": request,
+    result_data = user['result']
+    return render_page(request, user["uid"], etag, "result.html", {
         "result": result_data,
         "active_page": "more",
         "last_updated": last_updated
@@ -437,16 +684,18 @@ async def result(request: Request):
 
 @app.get("/more/profile")
 async def profile(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated", "profile"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated", "profile"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    profile_data = db.get_profile(user["uid"])
-    return templates.TemplateResponse("profile.html", {
-        "request": request,
+    profile_data = user['profile']
+    return render_page(request, user["uid"], etag, "profile.html", {
         "profile_data": profile_data,
         "active_page": "more",
         "last_updated": last_updated
@@ -454,16 +703,18 @@ async def profile(request: Request):
 
 @app.get("/more/leaves")
 async def leaves(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated", "leaves"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated", "leaves"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    leaves_data = db.get_leaves(user["uid"])
-    return templates.TemplateResponse("leaves.html", {
-        "request": request,
+    leaves_data = user['leaves']
+    return render_page(request, user["uid"], etag, "leaves.html", {
         "leaves": leaves_data,
         "active_page": "more",
         "last_updated": last_updated
@@ -471,16 +722,18 @@ async def leaves(request: Request):
 
 @app.get("/more/fees")
 async def fees(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated", "fees"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated", "fees"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    fees_data = db.get_fees(user["uid"])
-    return templates.TemplateResponse("fees.html", {
-        "request": request,
+    fees_data = user['fees']
+    return render_page(request, user["uid"], etag, "fees.html", {
         "fees": fees_data,
         "active_page": "more",
         "last_updated": last_updated
@@ -488,16 +741,18 @@ async def fees(request: Request):
 
 @app.get("/more/datesheet")
 async def datesheet(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated", "datesheet"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated", "datesheet"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    datesheet_data = db.get_datesheet(user["uid"])
-    return templates.TemplateResponse("datesheet.html", {
-        "request": request,
+    datesheet_data = user['datesheet']
+    return render_page(request, user["uid"], etag, "datesheet.html", {
         "datesheet_data": datesheet_data,
         "active_page": "more",
         "last_updated": last_updated
@@ -505,17 +760,19 @@ async def datesheet(request: Request):
 
 @app.get("/more/settings")
 async def settings(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    goal = db.get_attendance_goal(user['uid'])
+    goal = user.get('goal', 75)
     
-    return templates.TemplateResponse("settings.html", {
-        "request": request,
+    return render_page(request, user["uid"], etag, "settings.html", {
         "active_page": "more",
         "attendance_goal" : goal,
         "last_updated": last_updated
@@ -523,15 +780,17 @@ async def settings(request: Request):
 
 @app.get("/more/about")
 async def about(request: Request):
-    user = get_current_user(request)
+    etag, early = await revalidate(request, ["last_updated"])
+    if early:
+        return early
+    user = await load_page(request, ["last_updated"])
     if not user:
         return RedirectResponse(url="/login", status_code=302)
 
-    last_updated = db.get_last_updated(user['uid'])
+    last_updated = user['last_updated']
     last_updated = datetime.fromisoformat(last_updated) if last_updated != "Refreshing Data" else last_updated
 
-    return templates.TemplateResponse("about.html", {
-        "request": request,
+    return render_page(request, user["uid"], etag, "about.html", {
         "active_page": "more",
         "last_updated": last_updated
     })
@@ -541,13 +800,28 @@ class GoalInput(BaseModel):
 
 @app.post("/apply_settings")
 async def apply_settings(request: Request, data: GoalInput):
-    user = get_current_user(request)
+    user = await get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    db.set_goal_value(user["uid"], data.attendance_goal)
+    if not 0 <= data.attendance_goal <= 100:
+        raise HTTPException(status_code=400, detail="Goal must be between 0 and 100")
+
+    await adb.set_goal_value(user["uid"], data.attendance_goal)
+    # Projections are derived from the stored counts, so they follow the new goal right away.
+    await adb.recompute_attendance([user["uid"]])
 
-    return JSONResponse(content={"success": True})
+    # Reissue the token so the goal claim matches the stored goal.
+    access_token = create_access_token(data={"sub": user["uid"], "goal": data.attendance_goal, "ver": user["ver"]})
+    response = JSONResponse(content={"success": True})
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        max_age=30 * 24 * 60 * 60,  # 30 days
+        httponly=True,
+        secure=True
+    )
+    return response
 
 if __name__ == "__main__":
     import uvicorn
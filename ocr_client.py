@@ -0,0 +1,148 @@
+import asyncio
+import random
+import time
+from collections import deque
+import httpx
+from config import get_config
+import governor
+
+OCR_URL = 'https://api.ocr.space/parse/image'
+WHITELIST = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+client = None
+
+
+class OcrUnavailable(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_after_s=30):
+        self.failure_threshold = failure_threshold
+        self.reset_after_s = reset_after_s
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_after_s:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        # Returns (allowed, probe); only the probe may end the trial it started.
+        state = self.state
+        if state == "closed":
+            return True, False
+        # Half open: let exactly one request through to probe the provider.
+        if state == "half_open" and not self.trial:
+            self.trial = True
+            return True, True
+        return False, False
+
+    def end_trial(self):
+        self.trial = False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        self.trial = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class OcrClient:
+    def __init__(self, api_key, timeout=5.0, retries=2, breaker=None):
+        self.api_key = api_key
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 3.0)),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        )
+        self.requests = 0
+        self.errors = 0
+        self.short_circuited = 0
+        self.latencies_ms = deque(maxlen=500)
+
+    async def read(self, image_bytes):
+        # Screenshots are already PNG, so the bytes are uploaded untouched.
+        for attempt in range(self.retries + 1):
+            allowed, probe = self.breaker.allow()
+            if not allowed:
+                self.short_circuited += 1
+                raise OcrUnavailable(f"OCR circuit {self.breaker.state}")
+            started = time.perf_counter()
+            self.requests += 1
+            try:
+                async with governor.limit(OCR_URL) as call:
+                    response = call.check(await self.http.post(
+                        OCR_URL,
+                        files={'file': ('captcha.png', image_bytes, 'image/png')},
+                        data={'apikey': self.api_key, 'language': 'eng', 'isOverlayRequired': 'false'},
+                    ))
+                response.raise_for_status()
+                result = response.json()
+                if result.get('IsErroredOnProcessing'):
+                    raise ValueError(result.get('ErrorMessage') or "OCR processing error")
+                text = result['ParsedResults'][0]['ParsedText'].strip()
+            except (httpx.HTTPError, ValueError, KeyError, IndexError) as e:
+                self.errors += 1
+                self.breaker.failure()
+                print(f"OCR attempt {attempt + 1} failed: {e}")
+                if attempt < self.retries:
+                    await asyncio.sleep(0.2 * 2 ** attempt + random.uniform(0, 0.1))
+                continue
+            finally:
+                self.latencies_ms.append((time.perf_counter() - started) * 1000)
+                # Also runs when the probe is cancelled, so a half-open breaker can probe again.
+                if probe:
+                    self.breaker.end_trial()
+            self.breaker.success()
+            return ''.join(c for c in text if c in WHITELIST)
+        raise OcrUnavailable(f"OCR failed after {self.retries + 1} attempts")
+
+    async def close(self):
+        await self.http.aclose()
+
+    def stats(self):
+        latencies = sorted(self.latencies_ms)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.requests, 3) if self.requests else 0.0,
+            "short_circuited": self.short_circuited,
+            "breaker": self.breaker.state,
+            "latency_p50_ms": round(latencies[len(latencies) // 2], 1) if latencies else 0.0,
+            "latency_p95_ms": round(latencies[int(len(latencies) * 0.95)], 1) if latencies else 0.0,
+        }
+
+
+def init_client():
+    global client
+    if client is None:
+        config = get_config()
+        client = OcrClient(
+            config['OCR_KEY'],
+            timeout=config['OCR_TIMEOUT'],
+            retries=config['OCR_RETRIES'],
+            breaker=CircuitBreaker(
+                failure_threshold=config['OCR_BREAKER_FAILURES'],
+                reset_after_s=config['OCR_BREAKER_RESET_S'],
+            ),
+        )
+    return client
+
+
+async def close_client():
+    global client
+    if client is not None:
+        await client.close()
+        client = None
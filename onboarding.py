@@ -0,0 +1,155 @@
+import asyncio
+import time
+import browser_pool
+import leases
+from config import get_config
+
+manager = None
+
+
+class CapacityFull(Exception):
+    pass
+
+
+class Lease:
+    def __init__(self, uid):
+        self.uid = uid
+        self.context = None
+        self.page = None
+        self.created_at = time.time()
+        self.touched_at = self.created_at
+        self.ready = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.error = None
+        self.task = None
+        self.token = None
+
+    def touch(self):
+        self.touched_at = time.time()
+
+
+class OnboardingManager:
+    def __init__(self, max_sessions=4, idle_ttl_s=180, reap_interval_s=15, open_timeout_s=15):
+        self.max_sessions = max_sessions
+        self.open_timeout_s = open_timeout_s
+        self.idle_ttl_s = idle_ttl_s
+        self.reap_interval_s = reap_interval_s
+        self.leases = {}
+        self.reaper = None
+        self.opened = 0
+        self.completed = 0
+        self.reaped = 0
+        self.rejected = 0
+
+    def start(self):
+        if self.reaper is None:
+            self.reaper = asyncio.create_task(self._reap())
+
+    async def stop(self):
+        if self.reaper is not None:
+            self.reaper.cancel()
+            await asyncio.gather(self.reaper, return_exceptions=True)
+            self.reaper = None
+        for uid in list(self.leases):
+            await self.close(uid)
+
+    async def open(self, uid):
+        # A retry from the same user replaces their old lease instead of counting twice.
+        await self.close(uid)
+        # The slot is reserved before the next await, so a burst of sign-ups cannot all pass the check.
+        if len(self.leases) >= self.max_sessions or uid in self.leases:
+            self.rejected += 1
+            raise CapacityFull("Too many sign-ups in progress, try again shortly")
+        lease = Lease(uid)
+        self.leases[uid] = lease
+        # The shared lease tells other workers which one holds this user's browser.
+        owners = leases.init_manager()
+        try:
+            lease.token = await owners.acquire('onboarding', uid)
+        except Exception:
+            self.leases.pop(uid, None)
+            raise
+        if lease.token is None:
+            self.leases.pop(uid, None)
+            raise leases.LeaseHeld('onboarding', uid, await owners.owner('onboarding', uid))
+        lease.task = asyncio.create_task(self._hold(lease))
+        try:
+            # The pool may be busy with refreshes; a sign-up gets a quick 503 rather than an open-ended wait.
+            await asyncio.wait_for(lease.ready.wait(), timeout=self.open_timeout_s)
+        except asyncio.TimeoutError:
+            lease.error = CapacityFull("No browser free for sign-up right now, try again shortly")
+            self.rejected += 1
+            lease.task.cancel()
+        if lease.error is not None:
+            await self.close(uid)
+            raise lease.error
+        self.opened += 1
+        return lease
+
+    async def _hold(self, lease):
+        # The pooled context lives inside this task, so closing the lease always unwinds it.
+        try:
+            async with browser_pool.init_pool().context() as context:
+                lease.context = context
+                lease.page = await context.new_page()
+                lease.ready.set()
+                await lease.closed.wait()
+        except Exception as e:
+            lease.error = e
+        finally:
+            lease.ready.set()
+
+    def get(self, uid):
+        lease = self.leases.get(uid)
+        if lease is None or lease.page is None:
+            # Still reserving its browser.
+            return None
+        lease.touch()
+        return lease
+
+    async def close(self, uid, completed=False):
+        lease = self.leases.pop(uid, None)
+        if lease is None:
+            return
+        lease.closed.set()
+        if lease.task is not None:
+            await asyncio.gather(lease.task, return_exceptions=True)
+        if lease.token is not None:
+            await leases.init_manager().release('onboarding', uid, lease.token)
+        if completed:
+            self.completed += 1
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(self.reap_interval_s)
+            cutoff = time.time() - self.idle_ttl_s
+            for uid, lease in list(self.leases.items()):
+                if lease.touched_at < cutoff:
+                    print(f"Closing abandoned onboarding session for {uid}")
+                    self.reaped += 1
+                    await self.close(uid)
+
+    def stats(self):
+        now = time.time()
+        return {
+            "sessions": len(self.leases),
+            "max_sessions": self.max_sessions,
+            "oldest_idle_s": round(max((now - lease.touched_at for lease in self.leases.values()), default=0)),
+            "pool_memory_mb": browser_pool.init_pool().stats()["memory_mb"],
+            "opened": self.opened,
+            "completed": self.completed,
+            "reaped": self.reaped,
+            "rejected": self.rejected,
+        }
+
+
+def init_manager():
+    global manager
+    if manager is None:
+        config = get_config()
+        manager = OnboardingManager(
+            max_sessions=config['ONBOARDING_MAX_SESSIONS'],
+            idle_ttl_s=config['ONBOARDING_IDLE_TTL_S'],
+            open_timeout_s=config['ONBOARDING_OPEN_TIMEOUT_S'],
+        )
+    return manager
@@ -0,0 +1,53 @@
+import time
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+import governor
+import sections
+import timings
+
+# True once the row count under `selector` has not changed for `quiet_ms`.
+STABLE_ROWS_JS = """
+([selector, quietMs]) => {
+    const count = document.querySelectorAll(selector).length;
+    const watch = window.__rowWatch || (window.__rowWatch = {});
+    const now = performance.now();
+    const seen = watch[selector];
+    if (!seen || seen.count !== count) {
+        watch[selector] = {count, since: now};
+        return false;
+    }
+    return now - seen.since >= quietMs;
+}
+"""
+
+
+async def goto(page, url):
+    # The timeout is taken after the governor admits the call, so queueing eats into the budget.
+    async with governor.limit(url) as call:
+        call.check(await page.goto(url, timeout=max(1, timings.remaining_ms())))
+
+
+async def wait_ready(page, step):
+    started = time.perf_counter()
+    try:
+        for condition in sections.READY[step]:
+            timeout = timings.remaining_ms()
+            if timeout <= 0:
+                print(f"{step} ran out of its time budget while waiting.")
+                return False
+            if 'selector' in condition:
+                await page.wait_for_selector(condition['selector'], state='attached', timeout=timeout)
+            elif 'network_idle' in condition:
+                await page.wait_for_load_state('networkidle', timeout=timeout)
+            elif 'stable_rows' in condition:
+                await page.wait_for_function(
+                    STABLE_ROWS_JS,
+                    arg=[condition['stable_rows'], condition.get('quiet_ms', 300)],
+                    polling=100,
+                    timeout=timeout,
+                )
+        return True
+    except PlaywrightTimeoutError:
+        print(f"{step} not ready within its time budget, extracting what has loaded.")
+        return False
+    finally:
+        timings.add('wait_ms', started)
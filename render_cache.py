@@ -0,0 +1,58 @@
+import time
+import database as db
+from cache import TTLCache, MISSING
+from config import get_config
+
+cache = None
+
+
+class RenderCache:
+    def __init__(self, max_entries=2000, max_bytes=32 * 1024 * 1024, ttl_s=86400):
+        # One entry per user: {path: (etag, body)}, so a data write drops all of that user's pages at once.
+        self.pages = TTLCache(max_entries=max_entries, max_bytes=max_bytes, ttl_s=ttl_s)
+        self.served = 0
+        self.served_ms = 0.0
+        self.rendered = 0
+        self.rendered_ms = 0.0
+
+    def get(self, uid, path, etag):
+        started = time.perf_counter()
+        pages = self.pages.get(uid)
+        if pages is MISSING or pages.get(path, (None,))[0] != etag:
+            return None
+        self.served += 1
+        self.served_ms += (time.perf_counter() - started) * 1000
+        return pages[path][1]
+
+    def set(self, uid, path, etag, body, render_ms):
+        self.rendered += 1
+        self.rendered_ms += render_ms
+        pages = self.pages.get(uid)
+        pages = {} if pages is MISSING else dict(pages)
+        pages[path] = (etag, body)
+        self.pages.set(uid, pages)
+
+    def invalidate(self, uid, section=None):
+        self.pages.invalidate(uid)
+
+    def stats(self):
+        return {
+            **self.pages.stats(),
+            "served": self.served,
+            "avg_served_ms": round(self.served_ms / self.served, 3) if self.served else 0.0,
+            "rendered": self.rendered,
+            "avg_render_ms": round(self.rendered_ms / self.rendered, 3) if self.rendered else 0.0,
+        }
+
+
+def init_cache():
+    global cache
+    if cache is None:
+        config = get_config()
+        cache = RenderCache(
+            max_entries=config['RENDER_CACHE_MAX_ENTRIES'],
+            max_bytes=config['RENDER_CACHE_MAX_MB'] * 1024 * 1024,
+            ttl_s=config['RENDER_CACHE_TTL_S'],
+        )
+        db.invalidation_listeners.append(cache.invalidate)
+    return cache
@@ -0,0 +1,89 @@
+from collections import OrderedDict
+from urllib.parse import urlparse
+import sections
+
+# Sizes of responses we have let through, used to estimate what a blocked request would have cost.
+known_sizes = OrderedDict()
+MAX_KNOWN_SIZES = 2000
+
+# Most blocked types are never let through on scrape pages, so a URL we have not seen falls back to a
+# typical size for its type (rough transfer sizes of the portal's assets). bytes_avoided is an estimate.
+TYPICAL_SIZES = {
+    'image': 25_000,
+    'media': 200_000,
+    'font': 40_000,
+    'stylesheet': 20_000,
+    'script': 50_000,
+    'xhr': 5_000,
+    'fetch': 5_000,
+}
+
+totals = {
+    "requests_allowed": 0,
+    "requests_avoided": 0,
+    "bytes_avoided": 0,
+}
+
+
+def _learn_size(response):
+    length = response.headers.get('content-length')
+    if length and length.isdigit():
+        known_sizes[response.url] = int(length)
+        known_sizes.move_to_end(response.url)
+        while len(known_sizes) > MAX_KNOWN_SIZES:
+            known_sizes.popitem(last=False)
+
+
+def is_blocked(policy, request):
+    url = request.url
+    if request.resource_type == 'document':
+        return False
+    if any(pattern in url for pattern in policy.get('allow_urls', [])):
+        return False
+    if any(pattern in url for pattern in policy.get('block_urls', [])):
+        return True
+    if request.resource_type in policy.get('block_types', []):
+        return True
+    if policy.get('block_third_party_types') and urlparse(url).hostname != urlparse(sections.BASE_URL).hostname:
+        return request.resource_type in policy['block_third_party_types']
+    return False
+
+
+class RequestFilter:
+    def __init__(self):
+        self.requests_allowed = 0
+        self.requests_avoided = 0
+        self.bytes_avoided = 0
+        self.avoided_by_type = {}
+
+    async def attach(self, page, section):
+        policy = sections.ROUTE_POLICIES.get(section, sections.ROUTE_POLICIES['default'])
+
+        async def handle(route):
+            request = route.request
+            if is_blocked(policy, request):
+                self._record_blocked(request)
+                await route.abort()
+            else:
+                self.requests_allowed += 1
+                totals["requests_allowed"] += 1
+                await route.continue_()
+
+        await page.route("**/*", handle)
+        page.on("response", _learn_size)
+
+    def _record_blocked(self, request):
+        size = known_sizes.get(request.url) or TYPICAL_SIZES.get(request.resource_type, 0)
+        self.requests_avoided += 1
+        self.bytes_avoided += size
+        self.avoided_by_type[request.resource_type] = self.avoided_by_type.get(request.resource_type, 0) + 1
+        totals["requests_avoided"] += 1
+        totals["bytes_avoided"] += size
+
+    def stats(self):
+        return {
+            "requests_allowed": self.requests_allowed,
+            "requests_avoided": self.requests_avoided,
+            "bytes_avoided": self.bytes_avoided,
+            "avoided_by_type": self.avoided_by_type,
+        }
@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import time
+from collections import deque
+from datetime import datetime
+import async_database as adb
+import jobs
+import session_manager
+from config import get_config
+
+scheduler = None
+
+
+def parse_hours(spec):
+    # "7-10,17-19" -> {7, 8, 9, 17, 18}; end hours are exclusive.
+    hours = set()
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        start, _, end = part.partition('-')
+        hours.update(range(int(start), int(end or int(start) + 1)))
+    return hours
+
+
+def staleness_s(last_updated, now, refreshing=False, max_stale_s=24 * 3600):
+    try:
+        return max(0.0, (now - datetime.fromisoformat(last_updated)).total_seconds())
+    except (TypeError, ValueError):
+        # "Refreshing Data" is only fresh while some worker holds the refresh lease. Without one the
+        # refresh died with its worker, so the user goes to the front of the queue.
+        return 0.0 if refreshing else float(max_stale_s)
+
+
+class RefreshScheduler:
+    def __init__(self, password_for, mode='initial', workers=1, scan_s=300, stale_after_s=6 * 3600,
+                 max_stale_s=24 * 3600, peak_hours=None, retry_after_s=6 * 3600, active_boost=4.0):
+        self.password_for = password_for
+        self.mode = mode
+        self.workers = workers
+        self.scan_s = scan_s
+        self.stale_after_s = stale_after_s
+        self.max_stale_s = max_stale_s
+        self.peak_hours = peak_hours or set()
+        self.retry_after_s = retry_after_s
+        self.active_boost = active_boost
+        self.heap = []
+        self.queued = set()
+        self.backoff_until = {}
+        self.wakeup = asyncio.Event()
+        self.tasks = []
+        self.fleet = {}
+        self.dispatched = 0
+        self.completed = 0
+        self.failed = 0
+        self.blocked = 0
+        self.finished_at = deque(maxlen=10000)
+
+    def start(self):
+        if not self.workers:
+            return
+        self.tasks.append(asyncio.create_task(self._scan_loop()))
+        for _ in range(self.workers):
+            self.tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    def is_peak(self):
+        return datetime.now().hour in self.peak_hours
+
+    async def _scan_loop(self):
+        while True:
+            try:
+                await self.scan()
+            except Exception as e:
+                print(f"Refresh scheduler scan failed: {e}")
+            await asyncio.sleep(self.scan_s)
+
+    async def scan(self):
+        now = datetime.now()
+        active = session_manager.init_manager().active
+        ages = []
+        refreshing = set(await adb.get_lease_holders('refresh'))
+        for state in await adb.get_refresh_states():
+            uid = state['uid']
+            age = staleness_s(state.get('last_updated'), now, uid in refreshing, self.max_stale_s)
+            ages.append(age)
+            if age < self.stale_after_s or uid in self.queued or self.backoff_until.get(uid, 0) > time.time():
+                continue
+            # Stalest first; users who have been around recently count several times as stale.
+            priority = age * (self.active_boost if uid in active else 1.0)
+            heapq.heappush(self.heap, (-priority, age, uid))
+            self.queued.add(uid)
+        ages.sort()
+        self.fleet = {
+            "users": len(ages),
+            "stale": sum(1 for age in ages if age >= self.stale_after_s),
+            "staleness_p50_h": round(ages[len(ages) // 2] / 3600, 1) if ages else 0.0,
+            "staleness_p95_h": round(ages[int(len(ages) * 0.95)] / 3600, 1) if ages else 0.0,
+            "staleness_max_h": round(ages[-1] / 3600, 1) if ages else 0.0,
+        }
+        self.wakeup.set()
+
+    def _pop(self):
+        if not self.heap:
+            return None
+        if not self.is_peak():
+            return heapq.heappop(self.heap)[2]
+        # At peak only the very stale go out; everyone else waits for an off-peak window. The heap
+        # is ordered by boosted priority, not age, so the top entry says nothing about the rest.
+        overdue = [i for i, (_, age, _) in enumerate(self.heap) if age >= self.max_stale_s]
+        if not overdue:
+            return None
+        i = min(overdue, key=lambda i: self.heap[i])
+        entry = self.heap[i]
+        self.heap[i] = self.heap[-1]
+        self.heap.pop()
+        heapq.heapify(self.heap)
+        return entry[2]
+
+    async def _next(self):
+        while True:
+            uid = self._pop()
+            if uid is not None:
+                self.queued.discard(uid)
+                return uid
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=60)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            uid = await self._next()
+            if jobs.queue.is_active(uid):
+                continue
+            try:
+                password = await self.password_for(uid)
+                if password is None:
+                    continue
+                job = jobs.queue.submit(uid, self.mode, password, skip_if_fresh_s=self.stale_after_s)
+            except jobs.QueueFull:
+                self.backoff_until[uid] = time.time() + self.scan_s
+                await asyncio.sleep(self.scan_s / 10)
+                continue
+            except Exception as e:
+                print(f"Scheduled refresh for {uid} not submitted: {e}")
+                self.backoff_until[uid] = time.time() + self.retry_after_s
+                continue
+            self.dispatched += 1
+            await job.done.wait()
+            self.finished_at.append(time.time())
+            if job.status == "done":
+                self.completed += 1
+                self.backoff_until.pop(uid, None)
+            elif job.reason == "bad_password":
+                # Retrying a rejected password every few hours risks locking the CUIMS account.
+                self.failed += 1
+                self.blocked += 1
+                print(f"CUIMS rejected the stored password for {uid}; background refreshes stopped until the next good login")
+                await adb.block_refresh(uid, job.reason)
+            else:
+                self.failed += 1
+                self.backoff_until[uid] = time.time() + self.retry_after_s
+
+    def stats(self):
+        hour_ago = time.time() - 3600
+        return {
+            "queue_depth": len(self.heap),
+            "workers": self.workers,
+            "peak": self.is_peak(),
+            "dispatched": self.dispatched,
+            "completed": self.completed,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "per_hour": sum(1 for t in self.finished_at if t >= hour_ago),
+            "fleet": self.fleet,
+        }
+
+
+def init_scheduler(password_for):
+    global scheduler
+    if scheduler is None:
+        config = get_config()
+        scheduler = RefreshScheduler(
+            password_for,
+            mode=config['SCHEDULER_MODE'],
+            workers=config['SCHEDULER_WORKERS'],
+            scan_s=config['SCHEDULER_SCAN_S'],
+            stale_after_s=config['SCHEDULER_STALE_AFTER_S'],
+            max_stale_s=config['SCHEDULER_MAX_STALE_S'],
+            peak_hours=parse_hours(config['SCHEDULER_PEAK_HOURS']),
+            retry_after_s=config['SCHEDULER_RETRY_AFTER_S'],
+        )
+    return scheduler
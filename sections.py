@@ -0,0 +1,282 @@
+BASE_URL = "https://students.cuchd.in"
+
+URLS = {
+    'attendance': f"{BASE_URL}/frmStudentCourseWiseAttendanceSummary.aspx?type=etgkYfqBdH1fSfc255iYGw==",
+    'courses': f"{BASE_URL}/frmMyTimeTable.aspx",
+    'profile': f"{BASE_URL}/frmStudentProfile.aspx",
+    'marks': f"{BASE_URL}/frmStudentMarksView.aspx",
+    'fees': f"{BASE_URL}/frmAccountStudentDetails.aspx",
+    'result': f"{BASE_URL}/result.aspx",
+    'datesheet': f"{BASE_URL}/frmStudentDatesheet.aspx",
+    'duty_leave': f"{BASE_URL}/frmStudentApplyDutyLeave.aspx",
+    'medical_leave': f"{BASE_URL}/frmStudentMedicalLeaveApply.aspx",
+}
+
+ANALYTICS_URLS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "facebook.net",
+    "hotjar.com",
+    "clarity.ms",
+]
+
+# Which requests each page may skip. Clicks on fees and leaves tabs need real
+# layout, so those keep stylesheets; login keeps images so #imgCaptcha renders.
+ROUTE_POLICIES = {
+    'default': {
+        'block_types': ["image", "font", "media", "stylesheet"],
+        'block_urls': ANALYTICS_URLS,
+        'block_third_party_types': ["script", "xhr", "fetch"],
+    },
+    'login': {
+        'block_types': ["font", "media"],
+        'block_urls': ANALYTICS_URLS,
+    },
+    'marks': {
+        # The accordion is built by jQuery UI, which may come from a CDN.
+        'block_types': ["image", "font", "media", "stylesheet"],
+        'block_urls': ANALYTICS_URLS,
+    },
+    'fees': {
+        'block_types': ["image", "font", "media"],
+        'block_urls': ANALYTICS_URLS,
+    },
+    'leaves': {
+        'block_types': ["image", "font", "media"],
+        'block_urls': ANALYTICS_URLS,
+    },
+}
+
+# What "ready to extract" means for each page step, checked in order.
+READY = {
+    'attendance': [
+        {'selector': "#SortTable"},
+        {'stable_rows': "#SortTable > tbody tr"},
+    ],
+    'courses': [
+        {'selector': "xpath=/html/body/form/div[4]/div[3]/div/div[4]/div/table/tbody"},
+    ],
+    'timetable': [
+        {'selector': "xpath=//*[@id='ContentPlaceHolder1_grdMain']/tbody"},
+    ],
+    'profile': [
+        {'selector': ".stuProfileData .row"},
+    ],
+    'marks': [
+        {'selector': ".ui-accordion-header"},
+        {'stable_rows': ".ui-accordion-header"},
+    ],
+    'fees': [
+        {'selector': "#ctl00_ContentPlaceHolder1_RadTabStrip1 > div > ul > li:nth-child(2) > a > span > span > span"},
+    ],
+    'fees_history': [
+        {'network_idle': True},
+        {'stable_rows': "div[style*='border-bottom: 1px solid']"},
+    ],
+    'result': [
+        {'network_idle': True},
+    ],
+    'datesheet': [
+        {'network_idle': True},
+        {'stable_rows': "table tbody tr"},
+    ],
+    'leaves': [
+        {'network_idle': True},
+    ],
+    'leaves_tab': [
+        {'network_idle': True},
+        {'stable_rows': "table tbody tr"},
+    ],
+}
+
+# Total time a section may spend navigating and waiting, in milliseconds.
+BUDGET_MS = {
+    'attendance': 15000,
+    'courses': 15000,
+    'timetable': 10000,
+    'profile': 15000,
+    'marks': 15000,
+    'fees': 15000,
+    'result': 15000,
+    'datesheet': 15000,
+    'leaves': 25000,
+}
+
+ATTENDANCE_TABLE = {
+    'rows': "#SortTable > tbody tr",
+    'min_cells': 11,
+    'text': 'textContent',
+    'fields': {
+        'Course Code': 0,
+        'Title': 1,
+        'Eligible Delivered': 8,
+        'Eligible Attended': 9,
+        'Eligible Percentage': 10,
+    },
+}
+
+TIMETABLE_TABLE = {
+    'rows': "#ContentPlaceHolder1_grdMain > tbody tr",
+    'skip': 1,
+    'text': 'textContent',
+}
+
+COURSES_TABLE = {
+    'rows': "xpath=/html/body/form/div[4]/div[3]/div/div[4]/div/table/tbody//tr",
+    'skip': 1,
+    'min_cells': 2,
+    'text': 'textContent',
+    'fields': {
+        'course_code': 0,
+        'course_name': 1,
+    },
+}
+
+PROFILE_TABLES = {
+    'personal': {
+        'rows': ".stuProfileData .row .col-md-5.col-xs-6 .row",
+        'fields': {
+            'key': ".col-sm-4",
+            'value': ".col-sm-8",
+        },
+    },
+    'education_info': {
+        'rows': "#ContentPlaceHolder1_gvStudentQualification tbody tr",
+        'skip': 1,
+        'min_cells': 5,
+        'fields': {
+            'qualification': 0,
+            'steram': 1,
+            'school/college': 2,
+            'university/board': 3,
+            'passing_year': 4,
+        },
+    },
+    'contact_info': {
+        'rows': "#ContentPlaceHolder1_gvStudentContacts tbody tr",
+        'skip': 1,
+        'min_cells': 5,
+        'fields': {
+            'contact_type': 0,
+            'residence': 1,
+            'office': 2,
+            'mobile': 3,
+            'email_id': 4,
+        },
+    },
+}
+
+MARKS_TABLE = {
+    'rows': ".ui-accordion-header",
+    'fields': {
+        'subject': ".",
+        'experiments': {
+            'rows': "tbody tr",
+            'scope': "aria-controls",
+            'min_cells': 3,
+            'max_cells': 3,
+            'fields': {
+                'name': 0,
+                'max_marks': 1,
+                'marks_obtained': 2,
+            },
+        },
+    },
+}
+
+# jQuery UI adds .ui-accordion-header and aria-controls client side, so raw HTML
+# is matched on the accordion markup itself: each <h3> is followed by its panel.
+MARKS_HTML_TABLE = {
+    **MARKS_TABLE,
+    'rows': "h3",
+    'fields': {
+        **MARKS_TABLE['fields'],
+        'experiments': {**MARKS_TABLE['fields']['experiments'], 'scope': "next"},
+    },
+}
+
+# Payment History is the RadTabStrip's second tab; fetched over HTTP it may need a postback.
+FEES_POSTBACK = ("ctl00$ContentPlaceHolder1$RadTabStrip1", '{"type":0,"index":"1"}')
+
+FEES_TABLE = {
+    'rows': "div[style*='border-bottom: 1px solid']",
+    'min_cells': 4,
+    'fields': {
+        'date': ".transactions-date",
+        'month': ".transactions-month",
+        'trans_ref_no': {'cell': 1, 'selector': "span", 'index': 1},
+        'bank_ref_no': {'cell': 1, 'selector': "span", 'index': 3},
+        'payment_mode': {'cell': 1, 'selector': "span", 'index': 5},
+        'total_amt': {'cell': 2, 'selector': "div", 'index': 0},
+        'service_tax': {'cell': 2, 'selector': "div", 'index': 1},
+        'processing_fee': {'cell': 2, 'selector': "div", 'index': 2},
+        'status': 3,
+    },
+}
+
+RESULT_TABLES = {
+    'cgpa': {
+        'rows': "div[id$='divCGPA']",
+        'fields': {'value': "span"},
+    },
+    'semesters': {
+        'rows': "table[id$='dlResult'] > tbody > tr",
+        'fields': {
+            'semester': "[id*='dlResult_lblSem_']",
+            'sgpa': "[id*='dlResult_div_sticky_'] > span:nth-child(3)",
+            'subjects': {
+                'rows': "[id*='dlResult_Repeater1_'] > tbody > tr",
+                'skip': 1,
+                'min_cells': 4,
+                'fields': {
+                    'subject_code': 0,
+                    'subject_name': 1,
+                    'subject_credits': 2,
+                    'subject_grade_ob': 3,
+                },
+            },
+        },
+    },
+}
+
+DATESHEET_TABLE = {
+    'rows': "table tbody tr",
+    'skip': 1,
+    'min_cells': 10,
+    'fields': {
+        'exam_type': 0,
+        'datesheet_type': 1,
+        'course_code': 2,
+        'course_name': 3,
+        'slot_no': 4,
+        'exam_date': 7,
+        'exam_time': 8,
+        'exam_venue': [{'cell': 9, 'selector': "a", 'attr': "href"}, 9],
+    },
+}
+
+LEAVES_TABLE = {
+    'rows': "table tbody tr",
+    'skip': 1,
+    'min_cells': 8,
+    'fields': {
+        'dl_number': 1,
+        'dl_timing': 2,
+        'dl_category': 3,
+        'dl_type': 5,
+        'dl_date': 6,
+        'dl_status': 7,
+    },
+}
+
+# Sections that can be fetched without a browser once a session cookie exists.
+HTTP_SECTIONS = {'attendance', 'marks', 'result', 'datesheet', 'leaves', 'fees'}
+
+
+def engine_for(name, config):
+    engines = dict(
+        item.split('=', 1) for item in config['SCRAPE_ENGINES'].split(',') if '=' in item
+    )
+    engine = engines.get(name, engines.get('*', 'browser'))
+    return 'http' if engine == 'http' and name in HTTP_SECTIONS else 'browser'
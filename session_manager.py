@@ -0,0 +1,141 @@
+import asyncio
+import time
+from datetime import datetime
+import httpx
+import async_database as adb
+import governor
+import http_engine
+import sections
+from config import get_config
+
+HOME_URL = f"{sections.BASE_URL}/StudentHome.aspx"
+
+manager = None
+
+
+def cookies_expired(storage_state, host="students.cuchd.in", now=None):
+    # Session cookies carry expires = -1; only an explicit past expiry rules the session out.
+    now = now or time.time()
+    cookies = [
+        cookie for cookie in (storage_state or {}).get('cookies', [])
+        if host == cookie.get('domain', '').lstrip('.') or host.endswith('.' + cookie.get('domain', '').lstrip('.'))
+    ]
+    if not cookies:
+        return True
+    return any(0 < cookie.get('expires', -1) < now for cookie in cookies)
+
+
+class SessionManager:
+    def __init__(self, keepalive_interval_s=300, keepalive_after_s=900, active_window_s=86400, concurrency=4):
+        self.keepalive_interval_s = keepalive_interval_s
+        self.keepalive_after_s = keepalive_after_s
+        self.active_window_s = active_window_s
+        self.slots = asyncio.Semaphore(concurrency)
+        self.active = {}
+        self.checked = {}
+        self.task = None
+        self.missing = 0
+        self.expired = 0
+        self.invalid = 0
+        self.reused = 0
+        self.logins = 0
+        self.kept_alive = 0
+        self.reused_ages_s = []
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._keep_alive())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def seen(self, uid):
+        self.active[uid] = time.time()
+
+    async def probe(self, storage_state):
+        # One plain GET with the saved cookies; a redirect means the site sent us back to login.
+        try:
+            async with governor.limit(HOME_URL) as call:
+                response = call.check(await http_engine.init_client().get(
+                    HOME_URL, headers={"Cookie": http_engine.cookie_header(storage_state)}
+                ))
+        except httpx.HTTPError as e:
+            print(f"Session probe failed: {e}")
+            return False
+        return response.status_code == 200
+
+    async def validate(self, uid, record):
+        storage_state = (record or {}).get('storage')
+        if not storage_state:
+            self.missing += 1
+            return None
+        if cookies_expired(storage_state):
+            self.expired += 1
+            return None
+        if not await self.probe(storage_state):
+            self.invalid += 1
+            return None
+        self.reused += 1
+        self.checked[uid] = time.time()
+        if record.get('saved_at'):
+            self.reused_ages_s.append((datetime.utcnow() - record['saved_at']).total_seconds())
+            del self.reused_ages_s[:-500]
+        await adb.touch_session(uid, reused=True)
+        return storage_state
+
+    def record_login(self, uid):
+        self.logins += 1
+        self.checked[uid] = time.time()
+
+    async def _keep_alive(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval_s)
+            now = time.time()
+            for uid, seen in list(self.active.items()):
+                if now - seen > self.active_window_s:
+                    del self.active[uid]
+                    self.checked.pop(uid, None)
+            due = [uid for uid in self.active if now - self.checked.get(uid, 0) >= self.keepalive_after_s]
+            await asyncio.gather(*(self._touch(uid) for uid in due), return_exceptions=True)
+
+    async def _touch(self, uid):
+        async with self.slots:
+            self.checked[uid] = time.time()
+            storage_state = await adb.load_session(uid)
+            if not storage_state or cookies_expired(storage_state):
+                return
+            # The probe itself is the keep-alive: it resets the server-side idle timeout.
+            if await self.probe(storage_state):
+                self.kept_alive += 1
+                await adb.touch_session(uid)
+
+    def stats(self):
+        ages = sorted(self.reused_ages_s)
+        attempts = self.reused + self.logins
+        return {
+            "reused": self.reused,
+            "logins": self.logins,
+            "hit_rate": round(self.reused / attempts, 3) if attempts else 0.0,
+            "missing": self.missing,
+            "expired": self.expired,
+            "invalid": self.invalid,
+            "kept_alive": self.kept_alive,
+            "active_users": len(self.active),
+            "reused_age_p50_s": round(ages[len(ages) // 2]) if ages else 0,
+            "reused_age_max_s": round(ages[-1]) if ages else 0,
+        }
+
+
+def init_manager():
+    global manager
+    if manager is None:
+        config = get_config()
+        manager = SessionManager(
+            keepalive_interval_s=config['SESSION_KEEPALIVE_INTERVAL_S'],
+            keepalive_after_s=config['SESSION_KEEPALIVE_AFTER_S'],
+            active_window_s=config['SESSION_ACTIVE_WINDOW_S'],
+        )
+    return manager
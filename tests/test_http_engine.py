@@ -0,0 +1,147 @@
+import asyncio
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+import governor
+import http_engine
+import sections
+from cuims_scrapper import CUIMSScraper
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+STORAGE_STATE = {
+    'cookies': [
+        {'name': 'ASP.NET_SessionId', 'value': 'abc123', 'domain': 'students.cuchd.in', 'path': '/', 'expires': -1},
+        {'name': '.ASPXAUTH', 'value': 'token', 'domain': '.cuchd.in', 'path': '/', 'expires': -1},
+        {'name': 'other', 'value': 'x', 'domain': 'example.com', 'path': '/', 'expires': -1},
+    ]
+}
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+class StandIn(BaseHTTPRequestHandler):
+    # Serves recorded CUIMS pages; anything without the session cookie is bounced to login like the real site.
+    pages = {
+        '/frmStudentCourseWiseAttendanceSummary.aspx': 'attendance.html',
+        '/frmStudentMarksView.aspx': 'marks.html',
+        '/frmAccountStudentDetails.aspx': 'fees_overview.html',
+    }
+    postbacks = []
+
+    def log_message(self, *args):
+        pass
+
+    def _authorised(self):
+        if 'ASP.NET_SessionId=abc123' in self.headers.get('Cookie', ''):
+            return True
+        self.send_response(302)
+        self.send_header('Location', '/Login.aspx')
+        self.end_headers()
+        return False
+
+    def _html(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self._authorised():
+            return
+        page = self.pages.get(urlsplit(self.path).path)
+        if page is None:
+            self.send_error(404)
+            return
+        self._html(fixture(page))
+
+    def do_POST(self):
+        if not self._authorised():
+            return
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        StandIn.postbacks.append(form)
+        if urlsplit(self.path).path == '/frmAccountStudentDetails.aspx' and form.get('__VIEWSTATE'):
+            self._html(fixture('fees_history.html'))
+        else:
+            self.send_error(400)
+
+
+@pytest.fixture(scope='module')
+def base_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def run(coro):
+    # The pooled client and the governor's locks belong to one event loop, so each test starts fresh.
+    async def scoped():
+        http_engine.client = None
+        governor.governor = None
+        try:
+            return await coro
+        finally:
+            await http_engine.close_client()
+    return asyncio.run(scoped())
+
+
+def test_cookie_header_only_sends_cookies_for_cuims():
+    assert http_engine.cookie_header(STORAGE_STATE) == "ASP.NET_SessionId=abc123; .ASPXAUTH=token"
+
+
+def test_attendance_rows_match_browser_fields(base_url):
+    scraper = http_engine.HttpScraper(STORAGE_STATE)
+    url = f"{base_url}/frmStudentCourseWiseAttendanceSummary.aspx?type=etgkYfqBdH1fSfc255iYGw=="
+    tables = run(scraper.extract(url, {'table': sections.ATTENDANCE_TABLE}))
+    assert tables['table'] == [
+        {'Course Code': '22CSH-311', 'Title': 'Design and Analysis of Algorithms',
+         'Eligible Delivered': '40', 'Eligible Attended': '34', 'Eligible Percentage': '85.00'},
+        {'Course Code': '22CSH-312', 'Title': 'Computer Networks',
+         'Eligible Delivered': '36', 'Eligible Attended': '26', 'Eligible Percentage': '72.22'},
+    ]
+
+
+def test_marks_accordion_is_parsed_from_raw_html(base_url):
+    scraper = http_engine.HttpScraper(STORAGE_STATE)
+    tables = run(scraper.extract(f"{base_url}/frmStudentMarksView.aspx", {'table': sections.MARKS_HTML_TABLE}))
+    marks = CUIMSScraper()._parse_marks(tables['table'])
+    assert list(marks) == ['Design and Analysis of Algorithms (22CSH-311)', 'Computer Networks (22CSH-312)']
+    assert marks['Design and Analysis of Algorithms (22CSH-311)']['experiments'] == [
+        {'name': 'Experiment 1', 'max_marks': '10', 'marks_obtained': '9'},
+        {'name': 'Experiment 2', 'max_marks': '10', 'marks_obtained': '8.5'},
+    ]
+
+
+def test_fees_tab_is_opened_with_a_postback(base_url):
+    StandIn.postbacks.clear()
+    scraper = http_engine.HttpScraper(STORAGE_STATE)
+    tables = run(scraper.extract(
+        f"{base_url}/frmAccountStudentDetails.aspx", {'table': sections.FEES_TABLE}, postback=sections.FEES_POSTBACK
+    ))
+    [form] = StandIn.postbacks
+    assert form['__VIEWSTATE'] == ['/wEPDwULLTE0NjQ5ODM0NjZkZA==']
+    assert form['__EVENTVALIDATION'] == ['/wEdAAOY0cQ3pA==']
+    assert form['__EVENTTARGET'] == [sections.FEES_POSTBACK[0]]
+    assert form['__EVENTARGUMENT'] == [sections.FEES_POSTBACK[1]]
+    [row] = tables['table']
+    assert row['trans_ref_no'] == 'CU2025071200431'
+    assert row['payment_mode'] == 'Net Banking'
+    assert row['total_amt'] == '60000.00'
+    assert row['status'] == 'Success'
+
+
+def test_redirect_to_login_raises_session_expired(base_url):
+    scraper = http_engine.HttpScraper({'cookies': []})
+    with pytest.raises(http_engine.SessionExpired):
+        run(scraper.fetch(f"{base_url}/frmStudentMarksView.aspx"))
@@ -0,0 +1,38 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar('section_timings', default=None)
+_deadline = contextvars.ContextVar('section_deadline', default=None)
+
+DEFAULT_TIMEOUT_MS = 30000
+
+
+@contextmanager
+def track_section(budget_ms=None):
+    timings = {'extract_ms': 0.0, 'wait_ms': 0.0}
+    started = time.perf_counter()
+    token = _current.set(timings)
+    deadline_token = _deadline.set(started + budget_ms / 1000 if budget_ms else None)
+    try:
+        yield timings
+    finally:
+        timings['total_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        for kind in ('extract_ms', 'wait_ms', 'fetch_ms'):
+            if kind in timings:
+                timings[kind] = round(timings[kind], 1)
+        _current.reset(token)
+        _deadline.reset(deadline_token)
+
+
+def add(kind, started):
+    timings = _current.get()
+    if timings is not None:
+        timings[kind] = timings.get(kind, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def remaining_ms():
+    deadline = _deadline.get()
+    if deadline is None:
+        return DEFAULT_TIMEOUT_MS
+    return max(0, (deadline - time.perf_counter()) * 1000)